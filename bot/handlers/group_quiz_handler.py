@@ -1,25 +1,23 @@
 import asyncio
 import logging
-from datetime import datetime, timezone
-import random
-from zoneinfo import ZoneInfo
+from collections import Counter
+from typing import AsyncIterator, List, Optional
 
-import aiogram
 from aiogram.filters import Command
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database.models import Task, Group
-from config import GROUP_CHAT_ID
+from sqlalchemy.orm import load_only
+from database.models import Task
+from config import PUBLISH_WAIT_TIMEOUT, PUBLISH_FETCH_BATCH_SIZE
 
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
+from bot.services.group_routing import group_routing
+from bot.services.publish_queue import publish_queue
 from bot.states import QuizStates
 
 
 
-router = Router()
-
-
 # Создаем роутер
 group_publisher_router = Router()
 
@@ -35,23 +33,65 @@ logging.info("Запущена публикация задач в группы."
 
 
 
-''' проверка работы роутера '''
-@group_publisher_router.message()
-async def handle_all_messages(message: types.Message):
-    logging.info(f"[group_quiz_handler] Получено сообщение: {message.text}")
+@group_publisher_router.message(Command("reload_groups"))
+async def reload_groups(message: types.Message):
+    """
+    Перечитывает таблицу групп из базы данных (после добавления или изменения групп).
+    """
+    try:
+        count = await group_routing.load()
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении таблицы групп: {e}")
+        await message.answer("Ошибка при обновлении списка групп.")
+        return
+    await message.answer(f"Список групп обновлён: {count} шт.")
+
 
 
+def get_unpublished_tasks_query(last_id: int, limit: int):
+    """
+    Запрос страницы неопубликованных задач после задачи last_id (использует индекс ix_tasks_unpublished_id).
+    """
+    return (
+        select(Task)
+        .options(load_only(Task.id, Task.topic, Task.language))
+        .where(Task.published.is_(False), Task.id > last_id)
+        .order_by(Task.id)
+        .limit(limit)
+    )
 
 
-async def fetch_tasks(session: AsyncSession):
+async def iter_unpublished_task_pages(session: AsyncSession,
+                                      batch_size: int = PUBLISH_FETCH_BATCH_SIZE) -> AsyncIterator[List[Task]]:
     """
-    Получает все задачи из базы данных.
+    Отдаёт неопубликованные задачи страницами в порядке ID.
+
+    Страницы выбираются по ключу (WHERE id > последний ID ORDER BY id LIMIT n), поэтому каждый
+    запрос использует первичный ключ и не зависит от размера таблицы. Загружаются только поля,
+    нужные для постановки в очередь публикации (текст и ответы задачи загружает воркер очереди),
+    а отданные задачи отсоединяются от сессии — в памяти одновременно находится не больше одной страницы.
     """
-    async with session.begin():
-        result = await session.execute(select(Task))
+    last_id = 0
+    total = 0
+    while True:
+        result = await session.execute(get_unpublished_tasks_query(last_id, batch_size))
         tasks = result.scalars().all()
-        logging.info(f"Найдено задач: {len(tasks)}")  # Лог для проверки количества задач
-        return tasks
+        # Завершаем транзакцию чтения, чтобы не держать её открытой, пока страница обрабатывается
+        await session.commit()
+        if not tasks:
+            break
+
+        for task in tasks:
+            session.expunge(task)
+        total += len(tasks)
+        last_id = tasks[-1].id
+
+        yield tasks
+
+        if len(tasks) < batch_size:
+            break
+
+    logging.info(f"Найдено неопубликованных задач: {total}")
 
 
 
@@ -73,12 +113,10 @@ async def fetch_task_by_id(session: AsyncSession, task_id: int):
 
 async def get_group_for_task(session: AsyncSession, task: Task):
     """
-    Получает группу из базы данных, соответствующую теме и языку задачи.
+    Получает группу, соответствующую теме и языку задачи, из таблицы маршрутизации в памяти.
     """
     try:
-        group_query = select(Group).where(Group.topic == task.topic, Group.language == task.language)
-        group_result = await session.execute(group_query)
-        group_instance = group_result.scalar_one_or_none()
+        group_instance = await group_routing.get(task.topic, task.language)
 
         if group_instance:
             logging.info(f"Найдена группа для публикации: ID={group_instance.id}, Имя={group_instance.group_name}, Язык={group_instance.language}")
@@ -94,199 +132,93 @@ async def get_group_for_task(session: AsyncSession, task: Task):
 
 
 
-async def publish_task(message: types.Message, task: Task, session: AsyncSession):
-    """
-    Публикует одну задачу в соответствующую группу на основе языка и темы задачи.
+async def publish_task(message: types.Message, task: Task, session: AsyncSession) -> Optional[int]:
     """
+    Ставит задачу в очередь публикации в группу, соответствующую языку и теме задачи.
+    Сами сообщения отправляют воркеры очереди публикации.
 
-    # Словари для различных фраз на нескольких языках
-    DONT_KNOW_OPTIONS = {
-        'ru': "Я не знаю, но хочу узнать",
-        'en': "I don't know, but I want to learn",
-        'es': "No lo sé, pero quiero aprender",
-        'tr': "Bilmiyorum, ama öğrenmek istiyorum"
-    }
-
-    LEARN_MORE_TEXT = {
-        'ru': "Узнать подробнее",
-        'en': "Learn more",
-        'es': "Saber más",
-        'tr': "Daha fazla öğren"
-    }
-
-    POLL_TEXT = {
-        'ru': "Каким будет вывод?",
-        'en': "What will be the output?",
-        'es': "¿Cuál será el resultado?",
-        'tr': "Çıktı ne olacak?"
-    }
+    :return: ID задания в очереди или None, если группа не найдена.
+    """
+    group_instance = await get_group_for_task(session, task)
+    if not group_instance:
+        await message.answer(
+            f"Группа для темы '{task.topic}' и языка '{task.language}' не найдена. "
+            "Задача сохранена, но публикация не выполнена."
+        )
+        logging.error(f"Группа для темы '{task.topic}' и языка '{task.language}' не найдена. Публикация отменена.")
+        return None
 
-    try:
-        # Получаем язык и тему задачи
-        language = task.language
-        topic = task.topic
-
-        # Получаем внутренний ID группы из базы данных по языку и теме
-        group_query = select(Group).where(Group.language == language, Group.topic == topic)
-        group_instance = (await session.execute(group_query)).scalar_one_or_none()
-
-        if not group_instance:
-            await message.answer(
-                f"Группа для темы '{task.topic}' и языка '{task.language}' не найдена. "
-                "Задача сохранена, но публикация не выполнена."
-            )
-            logging.error(f"Группа для темы '{task.topic}' и языка '{task.language}' не найдена. Публикация отменена.")
-            return
+    job_id = await publish_queue.enqueue(task.id, group_instance.group_id)
+    logging.info(f"Задача с ID {task.id} поставлена в очередь публикации (задание {job_id}).")
+    return job_id
 
-        group_chat_id = group_instance.group_id  # Реальный Telegram ID группы
-        group_db_id = group_instance.id  # Внутренний ID группы в базе данных
-
-        # Отправляем картинку с темой и подтемой
-        intro_text = f"Тема: {task.topic}\nПодтема: {task.subtopic or 'Без подтемы'}"
-        try:
-            await message.bot.send_photo(chat_id=group_chat_id, photo=task.image_url, caption=intro_text)
-            logging.info(f"Сообщение с картинкой отправлено в группу {group_chat_id}: {task.image_url}")
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_task(message, task, session)  # Повтор после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке изображения в группу: {e}")
-            await message.answer(f"Ошибка при отправке изображения в группу: {e}")
-            return
 
-        # Перемешиваем варианты ответов и добавляем вариант "Я не знаю, но хочу узнать" в конец
-        wrong_answers = task.wrong_answers
-        correct_answer = task.correct_answer
-        options = wrong_answers + [correct_answer]
-
-        random.shuffle(options)
-
-        # Добавляем вариант "Я не знаю, но хочу узнать" на языке задачи
-        dont_know_option = DONT_KNOW_OPTIONS.get(task.language, "Я не знаю, но хочу узнать")
-        options.append(dont_know_option)
-        correct_option_id = options.index(correct_answer)
-
-        # Отправляем текст опроса
-        poll_text = POLL_TEXT.get(task.language, "Каким будет вывод?")
-        try:
-            await message.bot.send_message(chat_id=group_chat_id, text=poll_text)
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_task(message, task, session)  # Повтор после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке текста опроса: {e}")
-            await message.answer(f"Ошибка при отправке текста опроса: {e}")
-            return
-
-        # Отправляем сам опрос
-        try:
-            await message.bot.send_poll(
-                chat_id=group_chat_id,
-                question=task.question,
-                options=options,
-                type="quiz",
-                correct_option_id=correct_option_id,
-                explanation=task.explanation,
-                is_anonymous=False
-            )
-            logging.info(f"Опрос опубликован в группе {group_chat_id}: {task.question}")
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_task(message, task, session)  # Повтор после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке опроса: {e}")
-            await message.answer(f"Ошибка при отправке опроса: {e}")
-            return
+async def report_publish_results(message: types.Message, job_ids: List[int]) -> None:
+    """
+    Дожидается завершения публикации и сообщает администратору итог.
+    """
+    published = await publish_queue.wait_many(job_ids)
+    await message.answer(f"Публикация завершена: опубликовано {published} из {len(job_ids)} задач.")
+    logging.info(f"Публикация завершена: опубликовано {published} из {len(job_ids)} задач.")
 
-        # Отправляем кнопку "Узнать больше"
-        learn_more_text = LEARN_MORE_TEXT.get(task.language, "Узнать больше")
-        try:
-            await message.bot.send_message(
-                chat_id=group_chat_id,
-                text="Узнать подробнее:",
-                reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-                    [types.InlineKeyboardButton(text=learn_more_text, url=task.resource_link)]
-                ])
-            )
-            logging.info(f"Кнопка 'Узнать больше' отправлена в группу {group_chat_id}.")
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_task(message, task, session)  # Повтор после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке кнопки 'Узнать больше': {e}")
-            await message.answer(f"Ошибка при отправке кнопки 'Узнать больше': {e}")
-            return
 
-        # Обновляем поля задачи в базе данных после успешной публикации
-        success = await update_task_in_db(session, task, group_db_id)  # Используем внутренний ID группы
-        if success:
-            logging.info(f"Поля задачи с ID {task.id} успешно обновлены.")
-        else:
-            await message.answer(f"Ошибка при обновлении задачи с ID {task.id} в базе данных.")
+# Сколько тем без группы перечислять в сводке (лимит длины сообщения Telegram)
+MISSING_GROUPS_LIMIT = 20
 
-    except Exception as e:
-        logging.error(f"Ошибка при публикации задачи: {e}")
+# Фоновые задачи отчётов о публикации (ссылки нужны, чтобы задачи не были собраны сборщиком мусора)
+_report_tasks = set()
 
 
 
 
-async def update_task_in_db(session: AsyncSession, task: Task, group_db_id):
+def format_missing_groups(missing: Counter) -> str:
     """
-    Обновляет поля задачи в базе данных.
+    Сводка задач, для темы и языка которых не найдена группа.
     """
-    try:
-        # Устанавливаем необходимые поля
-        task.published = True
-        task.publish_date = datetime.datetime.utcnow()  # Используем наивное время
-        task.group_id = group_db_id  # Используем внутренний ID группы в базе данных
-
-        # Добавляем объект `task` в сессию, чтобы убедиться, что он отслеживается
-        session.add(task)
-
-        # Коммитим изменения
-        await session.commit()
-        logging.info(f"Задача с ID {task.id} успешно обновлена в базе данных.")
-        return True
-
-    except Exception as e:
-        logging.exception(f"Ошибка при обновлении задачи с ID {task.id}: {e}")
-        await session.rollback()
-        return False
-
-
+    lines = [f"Группа не найдена для задач: {sum(missing.values())}. Задачи сохранены, но не опубликованы."]
+    for (topic, language), count in missing.most_common(MISSING_GROUPS_LIMIT):
+        lines.append(f"• {topic} ({language}): {count}")
+    if len(missing) > MISSING_GROUPS_LIMIT:
+        lines.append(f"… и ещё тем: {len(missing) - MISSING_GROUPS_LIMIT}")
+    return "\n".join(lines)
 
 
 @group_publisher_router.message(Command("publish_tasks"))
 async def publish_tasks_in_group(message: types.Message, session: AsyncSession):
-    tasks = await fetch_tasks(session)
+    found = 0
+    job_ids = []
+    missing = Counter()  # (тема, язык) -> задач без группы
+    async for tasks in iter_unpublished_task_pages(session):
+        found += len(tasks)
+        jobs = []
+        for task in tasks:
+            group_instance = await group_routing.get(task.topic, task.language)
+            if group_instance is None:
+                missing[(task.topic, task.language)] += 1
+            else:
+                jobs.append((task.id, group_instance.group_id))
+        # Одна вставка в очередь на страницу задач
+        job_ids.extend(await publish_queue.enqueue_many(jobs))
 
-    if not tasks:
+    if not found:
         await message.answer("Нет задач для публикации.")
         logging.info("Нет задач для публикации.")
         return
 
-    for i, task in enumerate(tasks):
-        try:
-            await publish_task(message, task)
-            if (i + 1) % 2 == 0:
-                await asyncio.sleep(20)  # Пауза 15 секунд после пары сообщений
-            else:
-                await asyncio.sleep(3)  # Пауза 1 секунда между сообщениями
-        except Exception as e:
-            if "Flood control exceeded" in str(e):
-                retry_after = int(str(e).split("retry after ")[1].split()[0])
-                logging.warning(f"Попадание в Flood control, пауза на {retry_after + 10} секунд...")
-                await asyncio.sleep(retry_after + 10)
-            else:
-                logging.error(f"Неожиданная ошибка: {e}")
-                break
+    if missing:
+        await message.answer(format_missing_groups(missing))
+        logging.error(f"Группа не найдена для {sum(missing.values())} задач ({len(missing)} тем), публикация отменена.")
 
-    await message.answer("Все задачи успешно опубликованы.")
-    logging.info("Все задачи успешно опубликованы.")
+    await message.answer(f"В очередь публикации поставлено задач: {len(job_ids)}.")
+    logging.info(f"В очередь публикации поставлено задач: {len(job_ids)}.")
+
+    if not job_ids:
+        return
+
+    # Темп отправки задаёт ограничитель исходящих сообщений; итог сообщаем, когда очередь всё опубликует
+    report_task = asyncio.create_task(report_publish_results(message, job_ids))
+    _report_tasks.add(report_task)
+    report_task.add_done_callback(_report_tasks.discard)
 
 
 
@@ -306,7 +238,7 @@ async def ask_for_task_id(message: types.Message, state: FSMContext):
 
 
 
-@router.message(QuizStates.waiting_for_task_id)
+@group_publisher_router.message(QuizStates.waiting_for_task_id)
 async def publish_task_by_id(message: types.Message, state: FSMContext, session: AsyncSession):
     """
     Публикует конкретную задачу по введенному ID.
@@ -316,6 +248,8 @@ async def publish_task_by_id(message: types.Message, state: FSMContext, session:
     except ValueError:
         await message.answer("Пожалуйста, укажите корректный ID задачи. Пример: 1")
         return
+    # ID получен: дальше сообщения администратора снова обрабатываются как обычно
+    await state.clear()
 
     # Получаем задачу из базы данных
     try:
@@ -329,10 +263,18 @@ async def publish_task_by_id(message: types.Message, state: FSMContext, session:
         await message.answer(f"Задача с ID {task_id} не найдена.")
         return
 
-    # Публикуем задачу
+    # Публикуем задачу через очередь публикации
     try:
-        await publish_task(message, task, session)
-        await message.answer(f"Задача с ID {task_id} успешно опубликована.")
+        job_id = await publish_task(message, task, session)
+        if job_id is None:
+            return
+        published = await publish_queue.wait(job_id, timeout=PUBLISH_WAIT_TIMEOUT)
+        if published:
+            await message.answer(f"Задача с ID {task_id} успешно опубликована.")
+        elif published is None:
+            await message.answer(f"Задача с ID {task_id} поставлена в очередь публикации.")
+        else:
+            await message.answer(f"Ошибка при публикации задачи с ID {task_id}.")
     except Exception as e:
         logging.exception(f"Ошибка при публикации задачи с ID {task_id}: {e}")
         await message.answer(f"Ошибка при публикации задачи с ID {task_id}.")
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from aiogram import Router
+from aiogram.types import PollAnswer
+
+from database.database import poll_answer_buffer
+
+
+poll_answer_router = Router()
+
+
+@poll_answer_router.poll_answer()
+async def handle_poll_answer(poll_answer: PollAnswer):
+    """
+    Принимает ответ на опрос задачи и кладёт его в буфер статистики.
+    В базу ответы записываются пакетами фоновой задачей (см. PollAnswerBuffer).
+    """
+    user = poll_answer.user
+    # Голос от имени канала (voter_chat) или отзыв голоса не учитываются
+    if user is None or not poll_answer.option_ids:
+        return
+
+    poll_answer_buffer.put(
+        poll_answer.poll_id,
+        user.id,
+        poll_answer.option_ids,
+        datetime.utcnow(),
+        username=user.username,
+        language=user.language_code
+    )
@@ -1,30 +1,30 @@
-import asyncio
 import io
 import json
-import os
 import logging
-import random
+import tempfile
 
-import aiogram
-from PIL import Image
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message
 
-from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.keyboards.inline import topic_keyboard, get_confirmation_keyboard, get_publish_group_keyboard, \
     get_task_or_json_keyboard
 from bot.keyboards.reply import main_menu_keyboard
-from bot.services.image_service import generate_console_image, generate_image_name
-from bot.services.s3_service import upload_to_s3
+from bot.services.artifact_store import artifact_store, TASK_IMAGE_ARTIFACT
+from bot.services.group_routing import group_routing
+from bot.services.image_store import image_store
+from bot.services.import_service import TaskImportPipeline
+from bot.services.json_stream import iter_json_array
+from bot.services.publish_queue import publish_queue
+from bot.services.render_service import render_service
 from bot.services.text_service import is_valid_url
+from bot.services.telegram_service import save_task_file_id
 from bot.services.message_service import send_message_with_retry, send_photo_with_retry  # Добавлено для обработки ожидания
 from bot.states import QuizStates
-from config import GROUP_CHAT_ID
-from database.models import Task, Group
-from datetime import datetime
+from config import GROUP_CHAT_ID, JSON_STREAMING_THRESHOLD, PUBLISH_WAIT_TIMEOUT
+from database.models import Task
 
 
 quiz_router = Router()
@@ -175,16 +175,21 @@ async def process_question(message: types.Message, state: FSMContext):
     await state.update_data(question=task_text)
 
     logo_path = "assets/logo.png"
-    image = generate_console_image(task_text, logo_path)
+    try:
+        image_bytes = await render_service.render(task_text, logo_path)
+    except Exception as e:
+        logging.error(f"Ошибка при генерации изображения: {e}")
+        await send_message_with_retry(bot=message.bot,
+        chat_id=message.chat.id,
+        text=f"Ошибка при генерации изображения: {str(e)}")
+        return
     logging.info("Изображение с задачей сгенерировано.")
 
-    temp_file_path = "task_image.png"
-    image.save(temp_file_path)
-
     try:
+        # Отправляем уже закодированные PNG-байты, без временного файла
         await send_photo_with_retry(bot=message.bot,
             chat_id=message.chat.id,
-            photo=types.FSInputFile(temp_file_path))
+            photo=types.BufferedInputFile(image_bytes, filename="task_image.png"))
         logging.info("Изображение отправлено пользователю.")
         await send_message_with_retry(bot=message.bot,
         chat_id=message.chat.id,
@@ -194,10 +199,6 @@ async def process_question(message: types.Message, state: FSMContext):
         await send_message_with_retry(bot=message.bot,
         chat_id=message.chat.id,
         text=f"Ошибка при отправке изображения: {str(e)}")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            logging.info("Временный файл изображения удалён.")
 
     # Переход к этапу ввода вариантов ответов
     await state.set_state(QuizStates.waiting_for_answers)
@@ -294,12 +295,18 @@ async def process_resource_link(message: types.Message, state: FSMContext):
 
     # Получаем данные из состояния
     data = await state.get_data()
-    temp_file_path = "temp_task_image.png"
 
-    # Генерируем изображение и сохраняем во временный файл
-    image = generate_console_image(data['question'], "assets/logo.png")
-    image.save(temp_file_path)
-    await state.update_data(resource_link=resource_link, temp_image_path=temp_file_path)
+    # Генерируем изображение (повторно не рендерится — берётся из кэша после предпросмотра).
+    # PNG-байты хранятся в памяти отдельно для каждого пользователя и используются и для предпросмотра,
+    # и для загрузки в S3; в состояние FSM они не попадают
+    try:
+        image_bytes = await render_service.render(data['question'], "assets/logo.png")
+    except Exception as e:
+        logging.error(f"Ошибка при генерации изображения: {e}")
+        await message.answer(f"Ошибка при генерации изображения: {str(e)}")
+        return
+    artifact_store.put(state.key.chat_id, state.key.user_id, TASK_IMAGE_ARTIFACT, image_bytes)
+    await state.update_data(resource_link=resource_link)
 
     quiz_text = (
         f"Тема: {data['topic']}\n"
@@ -315,7 +322,8 @@ async def process_resource_link(message: types.Message, state: FSMContext):
 
     try:
         # Отправка изображения пользователю
-        await message.answer_photo(photo=types.FSInputFile(temp_file_path), caption=quiz_text,
+        await message.answer_photo(photo=types.BufferedInputFile(image_bytes, filename="task_image.png"),
+                                   caption=quiz_text,
                                    reply_markup=get_confirmation_keyboard())
         logging.info("Изображение и текст отправлены с кнопками подтверждения.")
 
@@ -345,15 +353,18 @@ async def confirm_quiz(callback: types.CallbackQuery, state: FSMContext, session
         return
 
 
-    # Генерация имени для изображения
-    image_name = generate_image_name(data['topic'])
-    logging.info(f"Генерация имени изображения: {image_name}")
-
-
     try:
-        # Загрузка изображения в S3
-        image_url = upload_to_s3(Image.open(data['temp_image_path']), image_name)
-        logging.info(f"Изображение успешно загружено в S3: {image_url}")
+        # Загрузка в S3 тех же PNG-байтов, что были показаны в предпросмотре (без повторного кодирования)
+        image_bytes = artifact_store.get(state.key.chat_id, state.key.user_id, TASK_IMAGE_ARTIFACT)
+        if image_bytes is None:
+            # Изображение вытеснено из памяти (TTL, лимит) — рендерим заново
+            image_bytes = await render_service.render(data['question'], "assets/logo.png")
+        # Ключ в S3 вычисляется по содержимому: уже загруженное изображение повторно не отправляется
+        stored = await image_store.store(image_bytes)
+        image_url = stored.url
+        logging.info(f"Изображение в S3: {image_url} (загружено заново: {stored.uploaded})")
+        # Байты изображения больше не нужны — освобождаем память
+        artifact_store.discard(state.key.chat_id, state.key.user_id, TASK_IMAGE_ARTIFACT)
         await state.update_data(image_url=image_url)
     except Exception as e:
         logging.error(f"Ошибка при загрузке изображения в S3: {e}")
@@ -428,7 +439,11 @@ async def confirm_quiz(callback: types.CallbackQuery, state: FSMContext, session
             f"Ссылка на ресурс: {data['resource_link']}"
         )
 
-        await callback.message.answer_photo(photo=image_url, caption=quiz_text, reply_markup=get_publish_group_keyboard())
+        sent_message = await callback.message.answer_photo(photo=image_url, caption=quiz_text,
+                                                           reply_markup=get_publish_group_keyboard())
+        # Запоминаем file_id, чтобы при публикации в группы не скачивать изображение из S3 заново
+        if sent_message.photo:
+            await save_task_file_id(new_task, sent_message.photo[-1].file_id)
         logging.info("Задача готова к запуску. Предлагаем опубликовать или отменить.")
     except Exception as e:
         logging.error(f"Ошибка при отправке задачи в чат: {e}")
@@ -442,13 +457,7 @@ async def cancel_quiz(callback: types.CallbackQuery, state: FSMContext):
     """
     Обработчик отмены викторины.
     """
-    data = await state.get_data()
-
-    # Удаление временного изображения
-    if os.path.exists(data.get('temp_image_path', '')):
-        os.remove(data['temp_image_path'])
-        logging.info("Временный файл изображения удалён после отмены.")
-
+    artifact_store.discard(state.key.chat_id, state.key.user_id)
     await callback.message.answer("Викторина отменена. Данные не были сохранены.")
     await callback.message.edit_reply_markup()
     await state.clear()
@@ -495,6 +504,44 @@ async def upload_tasks_via_json(message: Message, state: FSMContext):
 
 
 
+async def run_tasks_import(message: types.Message, state: FSMContext, session: AsyncSession, tasks, total=None):
+    """
+    Запускает конвейер импорта задач и сообщает администратору о прогрессе и результате.
+
+    :param tasks: Источник задач: список или потоковый разбор файла.
+    :param total: Количество задач в файле, если известно.
+    """
+    # Сообщение с прогрессом импорта, которое периодически обновляется
+    progress_message = await message.answer(
+        f"Импорт задач начат. Задач в файле: {total if total is not None else 'неизвестно (потоковый режим)'}"
+    )
+
+    async def report_progress(result):
+        await progress_message.edit_text(result.progress_text())
+
+    # Конвейер: проверка → рендеринг → загрузка в S3 → пакетная запись в БД
+    pipeline = TaskImportPipeline(session, progress_callback=report_progress)
+    result = await pipeline.run(tasks, total=total)
+
+    logging.info(f"Импорт задач завершён: сохранено {result.saved} из {result.received}.")
+    await progress_message.edit_text(result.progress_text())
+    await message.answer(result.summary_text())
+
+    # Отчёт по каждой задаче с ошибкой: короткий — сообщением, длинный — файлом
+    if result.errors:
+        if len(result.errors) <= 20:
+            await message.answer(f"Задачи с ошибками:\n{result.errors_report()}")
+        else:
+            await message.answer_document(
+                types.BufferedInputFile(result.errors_report().encode('utf-8'), filename="import_errors.txt"),
+                caption=f"Задач с ошибками: {len(result.errors)}"
+            )
+
+    # Сохраняем ID последней задачи в состояние FSM
+    if result.last_task_id:
+        await state.update_data(task_id=result.last_task_id)
+
+
 @quiz_router.message(QuizStates.waiting_for_file, F.document)
 async def process_tasks_file(message: types.Message, state: FSMContext, session: AsyncSession):
     try:
@@ -503,6 +550,16 @@ async def process_tasks_file(message: types.Message, state: FSMContext, session:
         file_info = await message.bot.get_file(document.file_id)
         logging.info(f"File info: {file_info.file_path}")
 
+        # Большие файлы разбираются потоково: задачи передаются в конвейер по мере чтения,
+        # и память не зависит от размера файла
+        if (document.file_size or 0) >= JSON_STREAMING_THRESHOLD:
+            logging.info(f"Потоковый импорт файла размером {document.file_size} байт.")
+            with tempfile.TemporaryFile() as file_buffer:
+                await message.bot.download_file(file_info.file_path, destination=file_buffer)
+                file_buffer.seek(0)
+                await run_tasks_import(message, state, session, iter_json_array(file_buffer, 'tasks'))
+            return
+
         # Загружаем файл в буфер
         file_buffer = io.BytesIO()
         await message.bot.download_file(file_info.file_path, destination=file_buffer)
@@ -521,42 +578,7 @@ async def process_tasks_file(message: types.Message, state: FSMContext, session:
         tasks = data['tasks']
         logging.info(f"Загружено задач: {len(tasks)}")
 
-        for task in tasks:
-            # Генерация изображения для каждой задачи (используем язык по умолчанию)
-            default_language = task.get('default_language', 'ru')
-            question = task['question'].get(default_language, '')
-            correct_answer = task['correct_answer'].get(default_language, '')
-            wrong_answers = task['wrong_answers'].get(default_language, [])
-            explanation = task['explanation'].get(default_language, '')
-            short_description = task['short_description'].get(default_language, '')
-
-            image = generate_console_image(question, "assets/logo.png")
-            image_name = generate_image_name(task['topic'])
-            image_url = upload_to_s3(image, image_name)
-
-            # Сохраняем задачу в базу данных, храним `wrong_answers` как JSON-список
-            new_task = Task(
-                topic=task['topic'],
-                subtopic=task.get('subtopic', ''),
-                question=question,
-                correct_answer=correct_answer,
-                wrong_answers=wrong_answers,  # Сохраняем как JSON
-                explanation=explanation,
-                resource_link=task['resource_link'],
-                image_url=image_url,
-                short_description=short_description,
-                default_language=default_language,
-                language=task.get('language', default_language)
-            )
-            session.add(new_task)
-
-        # Коммитим транзакцию
-        await session.commit()
-        logging.info(f"Все задачи сохранены в базу данных.")
-        await message.answer(f"Загружено задач: {len(tasks)}")
-
-        # Сохраняем ID последней задачи в состояние FSM
-        await state.update_data(task_id=new_task.id)
+        await run_tasks_import(message, state, session, tasks, total=len(tasks))
 
     except json.JSONDecodeError:
         await message.answer("Ошибка: Неверный формат файла. Пожалуйста, загрузите корректный JSON-файл.")
@@ -589,13 +611,7 @@ async def confirm_cancel(callback: types.CallbackQuery, state: FSMContext):
     """
     Обработчик отмены задачи.
     """
-    data = await state.get_data()
-
-    # Удаление временного изображения
-    if os.path.exists(data.get('temp_image_path', '')):
-        os.remove(data['temp_image_path'])
-        logging.info("Временный файл изображения удалён после отмены.")
-
+    artifact_store.discard(state.key.chat_id, state.key.user_id)
     await callback.message.answer(
         "Викторина отменена. Данные не были сохранены.",
         reply_markup=main_menu_keyboard()  # Отображаем главное меню
@@ -612,7 +628,8 @@ async def publish_to_group(callback: types.CallbackQuery, state: FSMContext, ses
     """
     Публикация задачи в группу.
 
-    Отправляет изображение и викторину в указанную группу и обновляет запись в базе данных.
+    Ставит задачу в очередь публикации и дожидается результата; если очередь занята дольше
+    PUBLISH_WAIT_TIMEOUT, публикация завершится в фоне.
     """
     data = await state.get_data()
     logging.info(f"Данные из состояния: {data}")
@@ -636,9 +653,7 @@ async def publish_to_group(callback: types.CallbackQuery, state: FSMContext, ses
         logging.info(f"Используем язык задачи для публикации: {language}")
 
         # Проверяем, есть ли группа для данной темы и языка
-        group_query = select(Group).where(Group.topic == task.topic, Group.language == language)
-        group = await session.execute(group_query)
-        group_instance = group.scalar_one_or_none()
+        group_instance = await group_routing.get(task.topic, language)
 
         if not group_instance:
             logging.warning(f"Группа для темы '{task.topic}' и языка '{language}' не найдена.")
@@ -659,127 +674,22 @@ async def publish_to_group(callback: types.CallbackQuery, state: FSMContext, ses
         logging.info(f"ID группы в базе данных (id): {group_db_id}")
 
 
-        # Отправляем изображение в группу с кнопкой "Узнать подробнее"
-        try:
-            await callback.bot.send_photo(
-                chat_id=group_chat_id,
-                photo=task.image_url,
-                caption=f"Тема: {task.topic}\nПодтема: {task.subtopic or 'Без подтемы'}",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="Узнать подробнее", url=task.resource_link)]
-                ])
-            )
-            logging.info(f"Изображение отправлено в группу: {task.image_url}")
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_to_group(callback, state, session)  # Попробуем снова после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке изображения в группу: {e}")
-            await callback.message.answer(f"Ошибка при отправке изображения в группу: {e}")
-            return
-
-        # Перемешивание вариантов ответов
-        options = task.wrong_answers + [task.correct_answer]
-        random.shuffle(options)  # Перемешиваем список вариантов
-
-        # Определяем индекс правильного ответа в перемешанном списке
-        correct_option_id = options.index(task.correct_answer)
-
-        # Отправляем опрос в группу
-        try:
-            await callback.bot.send_poll(
-                chat_id=group_chat_id,
-                question=task.question,
-                options=options,
-                type="quiz",
-                correct_option_id=correct_option_id,
-                explanation=task.explanation,
-                is_anonymous=False
-            )
-            logging.info(f"Опрос отправлен в группу: {task.question}")
-
-        except aiogram.exceptions.TelegramRetryAfter as e:
-            logging.warning(f"Попадание в лимит Telegram: ждем {e.retry_after} секунд.")
-            await asyncio.sleep(e.retry_after)
-            return await publish_to_group(callback, state, session)  # Повтор после ожидания
-        except Exception as e:
-            logging.error(f"Ошибка при отправке опроса: {e}")
-            await callback.message.answer(f"Ошибка при отправке опроса: {e}")
-            return
-
-        # Обновляем информацию о задаче в базе данных
-        current_time = datetime.utcnow()
-        logging.info(f"Обновление задачи: установка group_id = {group_db_id}")
-
-        stmt = (
-            update(Task)
-            .where(Task.id == task_id)
-            .values(
-                published=True,
-                publish_date=current_time,
-                group_id=group_db_id  # Используем ID записи группы из таблицы groups
-            )
-        )
-        await session.execute(stmt)
-        await session.flush()
-        await session.commit()
+        # Публикацию выполняют воркеры очереди: они продолжают с невыполненного шага после ошибки
+        job_id = await publish_queue.enqueue(task.id, group_chat_id)
+        logging.info(f"Задача с ID {task_id} поставлена в очередь публикации (задание {job_id}).")
 
-        logging.info(f"Задача с ID {task_id} успешно обновлена в базе данных и опубликована в группе.")
-        await callback.message.answer("Задача успешно опубликована в группе.")
+        published = await publish_queue.wait(job_id, timeout=PUBLISH_WAIT_TIMEOUT)
+        if published:
+            await callback.message.answer("Задача успешно опубликована в группе.")
+        elif published is None:
+            await callback.message.answer("Задача поставлена в очередь публикации и скоро появится в группе.")
+        else:
+            await callback.message.answer("Ошибка при публикации задачи в группу.")
 
     except Exception as e:
         logging.error(f"Ошибка при публикации задачи: {e}")
         await callback.message.answer(f"Произошла ошибка при публикации задачи: {str(e)}")
-        await session.rollback()
-        logging.info("Выполнен откат изменений")
 
     finally:
         await state.clear()
         logging.info("Состояние очищено.")
-
-
-
-
-async def publish_task_to_group(callback, task, group_chat_id, session):
-    try:
-        # Отправляем изображение в группу
-        await callback.bot.send_photo(
-            chat_id=group_chat_id,
-            photo=task.image_url,
-            caption=f"Тема: {task.topic}\nПодтема: {task.subtopic or 'Без подтемы'}"
-        )
-        logging.info(f"Изображение отправлено в группу: {task.image_url}")
-
-        # Отправляем викторину
-        options = task.wrong_answers + [task.correct_answer]  # Добавляем правильный ответ к неверным
-        await callback.bot.send_poll(
-            chat_id=group_chat_id,
-            question=task.question,
-            options=options,
-            type="quiz",
-            correct_option_id=options.index(task.correct_answer),
-            explanation=task.explanation,
-            is_anonymous=False
-        )
-        logging.info(f"Викторина отправлена: {task.question}")
-
-        # Обновление информации о задаче в базе данных
-        current_time = datetime.utcnow()
-        stmt = (
-            update(Task)
-            .where(Task.id == task.id)
-            .values(
-                published=True,
-                publish_date=current_time,
-                group_id=group_chat_id
-            )
-        )
-        await session.execute(stmt)
-        await session.commit()
-        logging.info(f"Задача с ID {task.id} успешно опубликована и обновлена в базе данных.")
-
-        await callback.message.answer(f"Задача успешно опубликована в группе.")
-    except Exception as e:
-        logging.error(f"Ошибка при публикации задачи в группу: {e}")
-        await callback.message.answer(f"Ошибка при публикации задачи в группу: {str(e)}")
@@ -0,0 +1,85 @@
+import logging
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.services.group_routing import group_routing
+from database.models import TaskAnswerStats, TopicAnswerStats
+
+
+stats_router = Router()
+
+# Сколько строк по темам выводить в одном сообщении (лимит длины сообщения Telegram)
+STATS_TOPICS_LIMIT = 40
+
+
+def get_topic_stats_query(limit: int = STATS_TOPICS_LIMIT):
+    """
+    Запрос агрегатов по темам (тема, язык, группа), самые активные первыми.
+    """
+    return select(TopicAnswerStats).order_by(TopicAnswerStats.answers.desc()).limit(limit)
+
+
+def get_task_stats_query(task_id: int):
+    """
+    Запрос агрегата одной задачи (по первичному ключу).
+    """
+    return select(TaskAnswerStats).where(TaskAnswerStats.task_id == task_id)
+
+
+def format_rate(correct: int, total: int) -> str:
+    return f"{correct / total:.0%}" if total else "—"
+
+
+@stats_router.message(Command("stats"))
+async def show_stats(message: Message, command: CommandObject, session: AsyncSession):
+    """
+    /stats — сложность тем по группам; /stats <id задачи> — статистика одной задачи.
+    Читаются только предвычисленные агрегаты, task_statistics не сканируется.
+    """
+    args = (command.args or '').strip()
+    try:
+        if args:
+            if not args.isdigit():
+                await message.answer("Использование: /stats или /stats <ID задачи>")
+                return
+            await send_task_stats(message, session, int(args))
+        else:
+            await send_topic_stats(message, session)
+    except Exception as e:
+        logging.error(f"Ошибка при получении статистики: {e}")
+        await message.answer("Ошибка при получении статистики.")
+
+
+async def send_task_stats(message: Message, session: AsyncSession, task_id: int):
+    stats = (await session.execute(get_task_stats_query(task_id))).scalar_one_or_none()
+    if stats is None:
+        await message.answer(f"По задаче {task_id} ещё нет ответов.")
+        return
+
+    await message.answer(
+        f"Задача {task_id} ({stats.topic}, {stats.language}):\n"
+        f"Ответов: {stats.answers}\n"
+        f"Верных: {stats.correct_answers} ({format_rate(stats.correct_answers, stats.answers)})\n"
+        f"Пользователей: {stats.unique_users}"
+    )
+
+
+async def send_topic_stats(message: Message, session: AsyncSession):
+    rows = (await session.execute(get_topic_stats_query())).scalars().all()
+    if not rows:
+        await message.answer("Ответов на опросы ещё нет.")
+        return
+
+    lines = ["Статистика по темам (тема, язык, группа): ответов / верных / пользователей"]
+    for stats in rows:
+        group = await group_routing.get(stats.topic, stats.language)
+        group_name = group.group_name if group is not None and group.group_id == stats.chat_id else stats.chat_id
+        lines.append(
+            f"• {stats.topic} ({stats.language}, {group_name}): {stats.answers} / "
+            f"{format_rate(stats.correct_answers, stats.answers)} / {stats.unique_users}"
+        )
+    await message.answer("\n".join(lines))
@@ -138,7 +138,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 # Импорт функции для создания главного меню
 from bot.keyboards.reply import main_menu_keyboard
-from database.database import add_user_if_not_exists
+from database.database import add_user_if_not_exists, user_write_buffer
 
 
 
@@ -159,4 +159,6 @@ async def start_command(message: Message):
 async def register_user(message: Message, session: AsyncSession):
     # Обработка регистрации пользователя
     await add_user_if_not_exists(message.from_user, session)
+    # Регистрация должна быть записана сразу, не дожидаясь фоновой записи буфера
+    await user_write_buffer.flush()
     await message.answer("Ваши данные обновлены в системе.")
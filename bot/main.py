@@ -4,13 +4,24 @@ from aiogram import Bot, Dispatcher, Router
 from aiogram.filters import Command
 from aiogram.types import Message
 from bot.handlers.group_quiz_handler import group_publisher_router
+from bot.handlers.poll_answer_handler import poll_answer_router
 from bot.handlers.quiz import quiz_router, router
+from bot.handlers.stats_handler import stats_router
 from bot.handlers.user_handler import user_router
 from bot.middlewares.db_middleware import DbSessionMiddleware
 from bot.middlewares.access_middleware import ChatAccessMiddleware
 from bot.middlewares.user_update_middleware import UserUpdateMiddleware
-from config import BOT_TOKEN, ALLOWED_USERS
-from database.database import async_sessionmaker
+from bot.middlewares.rate_limit_middleware import OutboundRateLimitMiddleware
+from bot.services.fsm_storage import create_fsm_storage
+from bot.services.group_routing import group_routing
+from bot.services.publish_queue import publish_queue
+from bot.services.rate_limiter import outbound_limiter
+from bot.services.render_service import render_service
+from bot.services.scheduler_service import post_scheduler
+from bot.services.s3_service import s3_uploader
+from config import BOT_TOKEN, ALLOWED_USERS, TELEGRAM_RETRY_AFTER_ATTEMPTS, FSM_STORAGE_URL
+from database.database import async_sessionmaker, user_write_buffer, poll_answer_buffer
+from database.engine import engine, log_pool_status
 from keyboards.reply import main_menu_keyboard  # Импорт функции для создания главного меню
 
 
@@ -30,7 +41,12 @@ start_router = Router()
 async def main():
     logging.basicConfig(level=logging.INFO)
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    # Состояния FSM в общем хранилище: мастер создания задачи переживает перезапуск
+    # и может продолжаться в любой копии бота
+    dp = Dispatcher(storage=await create_fsm_storage(FSM_STORAGE_URL))
+
+    # Все исходящие сообщения проходят через общий ограничитель частоты
+    bot.session.middleware(OutboundRateLimitMiddleware(outbound_limiter, TELEGRAM_RETRY_AFTER_ATTEMPTS))
 
     # Используем async_sessionmaker для создания сессий базы данных
     session_maker = async_sessionmaker
@@ -49,17 +65,50 @@ async def main():
     logging.info("Регистрация роутеров")
     dp.include_router(router)
     logging.info("Роутер 'router' зарегистрирован")
+    dp.include_router(stats_router)
+    logging.info("Роутер 'stats_router' зарегистрирован")
     dp.include_router(group_publisher_router)
     logging.info("Роутер 'group_publisher_router' зарегистрирован")
     dp.include_router(user_router)
     logging.info("Роутер 'user_router' зарегистрирован")
     dp.include_router(start_router)
     logging.info("Роутер 'start_router' зарегистрирован")
+    dp.include_router(poll_answer_router)
+    logging.info("Роутер 'poll_answer_router' зарегистрирован")
+
+    # Запускаем пул процессов для рендеринга изображений
+    render_service.start()
+
+    # Запускаем фоновую запись профилей пользователей
+    user_write_buffer.start()
+
+    # Запускаем фоновую запись ответов на опросы в статистику задач
+    poll_answer_buffer.start()
+
+    # Загружаем таблицу групп для публикации
+    await group_routing.load()
+    log_pool_status(engine)
+
+    # Запускаем очередь публикации (незавершённые публикации продолжаются)
+    await publish_queue.start(bot)
+
+    # Запускаем планировщик отложенных публикаций (пропущенные за время простоя догоняются)
+    post_scheduler.start()
 
     try:
         await dp.start_polling(bot)
     finally:
+        await post_scheduler.shutdown()
+        await publish_queue.shutdown()
+        await user_write_buffer.stop()
+        await poll_answer_buffer.stop()
+        logging.info(f"Статистика ответов на опросы: {poll_answer_buffer.stats()}")
+        await dp.storage.close()
+        render_service.shutdown()
+        s3_uploader.shutdown()
+        logging.info(f"Статистика исходящих сообщений: {outbound_limiter.stats()}")
         await bot.session.close()
+        await engine.dispose()
 
 
 if __name__ == "__main__":
@@ -3,7 +3,6 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-from database.database import add_user_if_not_exists
 
 
 
@@ -22,13 +21,5 @@ class ChatAccessMiddleware(BaseMiddleware):
                 logging.info(f"Сообщение отклонено: {'Не личный чат' if event.chat.type != 'private' else 'Пользователь не разрешен'}")
                 return
 
-            try:
-                # Используем контекстный менеджер для создания новой сессии
-                async with self.session_maker() as session:
-                    await add_user_if_not_exists(event.from_user, session)
-                    logging.info(f"Пользователь {event.from_user.id} добавлен в базу данных (если не существовал ранее).")
-            except Exception as e:
-                logging.error(f"Ошибка при добавлении пользователя {event.from_user.id} в базу данных: {e}")
-
         logging.info("Сообщение принято для обработки")
         return await handler(event, data)
\ No newline at end of file
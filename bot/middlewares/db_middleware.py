@@ -1,38 +1,22 @@
-import logging
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import sessionmaker
-
-from database.database import add_user_if_not_exists
 
 
 class DbSessionMiddleware(BaseMiddleware):
+    """
+    Открывает сессию базы данных на время обработки события и передаёт её хэндлерам.
+    Профиль пользователя обновляет UserUpdateMiddleware.
+
+    Отдельная ленивая обёртка над сессией не нужна: AsyncSession сама берёт соединение из пула
+    только при первом запросе, поэтому события, которые не работают с базой (/start, кнопки меню,
+    шаги FSM), соединение не занимают. Соединение возвращается в пул при commit()/rollback()
+    или при закрытии сессии после хэндлера; хэндлер, который после запросов долго общается
+    с Telegram, может завершить транзакцию раньше (как iter_unpublished_task_pages).
+    """
+
     def __init__(self, session_maker):
         self.session_maker = session_maker
 
     async def __call__(self, handler, event, data: dict):
         async with self.session_maker() as session:
             data['session'] = session
-            try:
-                if isinstance(event, (Message, CallbackQuery)):
-                    user = event.from_user
-                    logging.info(f"Полные данные пользователя: {user.model_dump_json(indent=2)}")
-
-                    user_data = {
-                        'id': user.id,
-                        'username': user.username,
-                        'language_code': user.language_code,
-                        'is_premium': user.is_premium,
-                        'added_to_attachment_menu': user.added_to_attachment_menu,
-                    }
-                    logging.info(f"Извлеченные данные пользователя: {user_data}")
-
-                    logging.info(f"Получено событие от пользователя: {user.id}")
-                    await add_user_if_not_exists(user, session)
-                else:
-                    logging.warning(f"Неизвестный тип события: {type(event)}")
-            except Exception as e:
-                logging.error(f"Ошибка при обработке данных пользователя: {e}")
-
-            return await handler(event, data)
\ No newline at end of file
+            return await handler(event, data)
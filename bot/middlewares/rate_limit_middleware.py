@@ -0,0 +1,38 @@
+import logging
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.services.rate_limiter import OutboundRateLimiter
+
+
+class OutboundRateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: пропускает все исходящие сообщения (send_*, copy, forward)
+    через общий ограничитель частоты, а ответ «Too Many Requests» превращает в паузу
+    для соответствующего чата и повтор запроса.
+    """
+
+    # Методы API, которые отправляют сообщения и учитываются лимитами Telegram
+    LIMITED_METHOD_PREFIXES = ('Send', 'Copy', 'Forward')
+
+    def __init__(self, limiter: OutboundRateLimiter, retry_attempts: int = 3):
+        self.limiter = limiter
+        self.retry_attempts = retry_attempts
+
+    async def __call__(self, make_request, bot, method):
+        if not type(method).__name__.startswith(self.LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.limiter.penalize(chat_id, e.retry_after)
+                if attempt > self.retry_attempts:
+                    raise
+                logging.warning(f"Попадание в лимит Telegram для чата {chat_id}: "
+                                f"повтор через {e.retry_after} секунд (попытка {attempt}).")
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import ARTIFACT_TTL, ARTIFACT_MAX_BYTES_PER_USER, ARTIFACT_MAX_TOTAL_BYTES
+
+
+ArtifactKey = Tuple[int, int, str]  # (chat_id, user_id, имя артефакта)
+
+# Изображение задачи, отрендеренное в мастере создания задачи
+TASK_IMAGE_ARTIFACT = 'task_image'
+
+
+class ArtifactStore:
+    """
+    Хранилище промежуточных файлов мастера создания задачи (например, отрендеренного изображения).
+
+    Данные хранятся в памяти по ключу (чат, пользователь, имя), поэтому несколько администраторов
+    могут создавать задачи одновременно, не мешая друг другу. Объём на пользователя и общий объём
+    ограничены (вытесняются давно не используемые артефакты), устаревшие артефакты удаляются по TTL.
+    В состоянии FSM хранятся только текстовые поля, без байтов изображений.
+    """
+
+    def __init__(self, ttl: float = 3600, max_bytes_per_user: int = 8 * 1024 * 1024,
+                 max_total_bytes: int = 128 * 1024 * 1024):
+        """
+        :param ttl: Время жизни артефакта в секундах с момента последнего сохранения.
+        :param max_bytes_per_user: Лимит объёма артефактов одного пользователя в чате.
+        :param max_total_bytes: Общий лимит объёма хранилища.
+        """
+        self.ttl = ttl
+        self.max_bytes_per_user = max_bytes_per_user
+        self.max_total_bytes = max_total_bytes
+        self._items = OrderedDict()  # ArtifactKey -> (bytes, время сохранения)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.evicted = 0
+        self.expired = 0
+
+    def put(self, chat_id: int, user_id: int, name: str, data: bytes) -> bool:
+        """
+        Сохраняет артефакт пользователя.
+
+        :return: False, если артефакт больше лимита на пользователя и не был сохранён.
+        """
+        if len(data) > self.max_bytes_per_user:
+            logging.warning(f"Артефакт '{name}' пользователя {user_id} ({len(data)} байт) превышает лимит и не сохранён.")
+            return False
+
+        key = (chat_id, user_id, name)
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (data, time.monotonic())
+            self._total_bytes += len(data)
+            self._purge_expired()
+            self._enforce_user_limit(chat_id, user_id, keep=key)
+            while self._total_bytes > self.max_total_bytes and len(self._items) > 1:
+                self._remove(next(iter(self._items)))
+                self.evicted += 1
+        return True
+
+    def get(self, chat_id: int, user_id: int, name: str) -> Optional[bytes]:
+        """
+        Возвращает артефакт пользователя или None, если его нет или он устарел.
+        """
+        key = (chat_id, user_id, name)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if self._is_expired(item):
+                self._remove(key)
+                self.expired += 1
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def discard(self, chat_id: int, user_id: int, name: Optional[str] = None) -> None:
+        """
+        Удаляет артефакт пользователя (или все его артефакты, если имя не указано).
+        """
+        with self._lock:
+            if name is not None:
+                self._remove((chat_id, user_id, name))
+                return
+            for key in [key for key in self._items if key[:2] == (chat_id, user_id)]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику хранилища.
+        """
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': self._total_bytes,
+                'evicted': self.evicted,
+                'expired': self.expired,
+            }
+
+    def _is_expired(self, item) -> bool:
+        return bool(self.ttl) and time.monotonic() - item[1] > self.ttl
+
+    def _remove(self, key: ArtifactKey) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._total_bytes -= len(item[0])
+
+    def _purge_expired(self) -> None:
+        for key in [key for key, item in self._items.items() if self._is_expired(item)]:
+            self._remove(key)
+            self.expired += 1
+
+    def _enforce_user_limit(self, chat_id: int, user_id: int, keep: ArtifactKey) -> None:
+        user_keys = [key for key in self._items if key[:2] == (chat_id, user_id)]
+        user_bytes = sum(len(self._items[key][0]) for key in user_keys)
+        for key in user_keys:
+            if user_bytes <= self.max_bytes_per_user:
+                break
+            if key == keep:
+                continue
+            user_bytes -= len(self._items[key][0])
+            self._remove(key)
+            self.evicted += 1
+
+
+# Общее хранилище артефактов мастера создания задач
+artifact_store = ArtifactStore(
+    ttl=ARTIFACT_TTL,
+    max_bytes_per_user=ARTIFACT_MAX_BYTES_PER_USER,
+    max_total_bytes=ARTIFACT_MAX_TOTAL_BYTES
+)
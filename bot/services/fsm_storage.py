@@ -0,0 +1,151 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from database.engine import engine, create_db_engine
+from database.models import FsmState
+
+
+def dumps_compact(data: Dict[str, Any]) -> str:
+    """
+    Сериализует данные состояния в компактный JSON (без пробелов, кириллица без экранирования).
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SqlStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в таблице fsm_states (PostgreSQL или SQLite).
+
+    Состояние и данные одного ключа хранятся в одной строке; данные — компактным JSON.
+    Строка удаляется, когда и состояние, и данные пусты, поэтому завершённые мастера
+    не оставляют записей. Байты изображений в данные не попадают (см. ArtifactStore).
+    """
+
+    def __init__(self, engine: AsyncEngine, key_builder: Optional[KeyBuilder] = None,
+                 dispose_engine: bool = False):
+        """
+        :param engine: Асинхронный движок базы данных.
+        :param key_builder: Построитель строковых ключей (по умолчанию как у RedisStorage).
+        :param dispose_engine: Закрывать движок при закрытии хранилища (если он создан только для FSM).
+        """
+        if engine.dialect.name == 'postgresql':
+            self._insert = postgresql.insert
+        elif engine.dialect.name == 'sqlite':
+            self._insert = sqlite.insert
+        else:
+            raise ValueError(f"SqlStorage не поддерживает базу данных '{engine.dialect.name}'")
+        self.engine = engine
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.dispose_engine = dispose_engine
+
+    async def create_table(self) -> None:
+        """
+        Создаёт таблицу fsm_states, если её нет (для SQLite; в PostgreSQL таблицу создаёт миграция).
+        """
+        async with self.engine.begin() as conn:
+            await conn.run_sync(FsmState.__table__.create, checkfirst=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._save(key, {'state': value})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._load(key)
+        return row.state if row is not None else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._save(key, {'data': dumps_compact(data) if data else None})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._load(key)
+        if row is None or not row.data:
+            return {}
+        return json.loads(row.data)
+
+    async def close(self) -> None:
+        if self.dispose_engine:
+            await self.engine.dispose()
+
+    async def _load(self, key: StorageKey):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(FsmState.state, FsmState.data).where(FsmState.key == self.key_builder.build(key))
+            )
+            return result.first()
+
+    async def _save(self, key: StorageKey, values: Dict[str, Optional[str]]) -> None:
+        storage_key = self.key_builder.build(key)
+        stmt = self._insert(FsmState).values(key=storage_key, updated_at=datetime.utcnow(), **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={**{name: stmt.excluded[name] for name in values}, 'updated_at': stmt.excluded.updated_at}
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt)
+            # Пустая запись не нужна: get_state/get_data вернут значения по умолчанию
+            await conn.execute(
+                delete(FsmState).where(
+                    FsmState.key == storage_key,
+                    FsmState.state.is_(None),
+                    FsmState.data.is_(None)
+                )
+            )
+
+
+def create_redis_storage(url: str) -> BaseStorage:
+    """
+    Создаёт хранилище FSM на Redis (или совместимом сервере) с компактной сериализацией данных.
+
+    URL вида fakeredis:// создаёт хранилище на встроенном в процесс fakeredis — для локального
+    запуска и проверки без сервера Redis.
+    """
+    try:
+        from aiogram.fsm.storage.redis import RedisStorage
+    except ImportError as e:
+        raise RuntimeError(f"Для FSM_STORAGE_URL={url} нужен пакет redis (pip install redis)") from e
+
+    if url.startswith('fakeredis://'):
+        try:
+            from fakeredis.aioredis import FakeRedis
+        except ImportError as e:
+            raise RuntimeError("Для FSM_STORAGE_URL=fakeredis:// нужен пакет fakeredis (pip install fakeredis)") from e
+        return RedisStorage(redis=FakeRedis(), json_dumps=dumps_compact)
+
+    return RedisStorage.from_url(url, json_dumps=dumps_compact)
+
+
+async def create_fsm_storage(url: str) -> BaseStorage:
+    """
+    Создаёт хранилище состояний FSM по URL из конфигурации.
+
+    - memory:// — в памяти процесса (состояния теряются при перезапуске, не разделяются между копиями бота);
+    - redis://, rediss://, unix:// — Redis; fakeredis:// — встроенный в процесс заменитель Redis;
+    - database — таблица fsm_states в основной базе данных (общий пул соединений);
+    - sqlite+aiosqlite://..., postgresql+asyncpg://... — таблица fsm_states в указанной базе данных.
+    """
+    if url in ('', 'memory://'):
+        storage = MemoryStorage()
+    elif url.startswith(('redis://', 'rediss://', 'unix://', 'fakeredis://')):
+        storage = create_redis_storage(url)
+    elif url == 'database':
+        storage = SqlStorage(engine)
+    elif url.startswith('sqlite'):
+        # У SQLite свой пул соединений без настроек QueuePool; таблицу создаём сами
+        storage = SqlStorage(create_async_engine(url), dispose_engine=True)
+        await storage.create_table()
+    elif url.startswith('postgresql'):
+        storage = SqlStorage(create_db_engine(url, pool_size=2, max_overflow=2), dispose_engine=True)
+    else:
+        raise ValueError(f"Неизвестное хранилище FSM: {url}")
+
+    logging.info(f"Хранилище состояний FSM: {type(storage).__name__} ({url.split('@')[-1] or 'memory://'})")
+    return storage
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import GROUP_ROUTING_TTL
+from database.database import async_sessionmaker
+from database.models import Group
+
+
+class GroupRoutingTable:
+    """
+    Таблица маршрутизации задач по группам: (тема, язык) -> группа.
+
+    Таблица groups меняется редко, поэтому она целиком держится в памяти и перечитывается
+    по истечении TTL или по явной команде (/reload_groups). Публикация находит группу
+    задачи без обращения к базе данных.
+    """
+
+    def __init__(self, session_maker, ttl: float = 300):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param ttl: Через сколько секунд таблица перечитывается из базы (0 — только по команде).
+        """
+        self.session_maker = session_maker
+        self.ttl = ttl
+        self._routes: Dict[Tuple[str, str], Group] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    async def load(self) -> int:
+        """
+        Перечитывает таблицу групп из базы данных.
+
+        :return: Количество загруженных групп.
+        """
+        async with self.session_maker() as session:
+            groups = (await session.execute(select(Group))).scalars().all()
+
+        self._routes = {(group.topic, group.language): group for group in groups}
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+        logging.info(f"Загружена таблица групп: {len(self._routes)} шт.")
+        return len(self._routes)
+
+    def invalidate(self) -> None:
+        """
+        Помечает таблицу устаревшей: она будет перечитана при следующем обращении.
+        """
+        self._loaded_at = None
+
+    async def get(self, topic: str, language: str) -> Optional[Group]:
+        """
+        Возвращает группу для темы и языка задачи или None, если такой группы нет.
+        """
+        if self._is_stale():
+            await self._reload()
+
+        group = self._routes.get((topic, language))
+        if group is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return group
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику таблицы маршрутизации.
+        """
+        return {
+            'groups': len(self._routes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+        }
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return bool(self.ttl) and time.monotonic() - self._loaded_at >= self.ttl
+
+    async def _reload(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Пока ждали блокировку, таблицу мог перечитать другой запрос
+            if not self._is_stale():
+                return
+            try:
+                await self.load()
+            except Exception as e:
+                if self._loaded_at is None and not self._routes:
+                    raise
+                # Продолжаем работать со старой таблицей и повторим загрузку через TTL
+                logging.error(f"Ошибка при обновлении таблицы групп: {e}")
+                self._loaded_at = time.monotonic()
+
+
+# Общая таблица маршрутизации по группам
+group_routing = GroupRoutingTable(async_sessionmaker, ttl=GROUP_ROUTING_TTL)
@@ -1,15 +1,45 @@
 import os
 import io
+import time
 import hashlib
-import datetime
+import logging
+from functools import lru_cache
+from typing import NamedTuple, Tuple
 from uuid import uuid4
 
+import pygments
 from PIL import Image, ImageDraw, ImageFont
-from pygments import highlight
 from pygments.lexers import PythonLexer
 from pygments.formatters import ImageFormatter
+from pygments.formatters.img import FontManager
 from pygments.styles import get_style_by_name
 
+from bot.services.render_cache import render_cache
+
+
+# Версия алгоритма отрисовки: увеличивайте при изменении внешнего вида, чтобы сбросить кэш
+RENDER_VERSION = 1
+
+# Геометрия изображения и консольного окна
+IMAGE_SIZE = (800, 500)
+CONSOLE_SIZE = (700, 350)
+
+# Стиль подсветки кода
+CODE_STYLE = 'monokai'
+
+# Допустимый диапазон размеров шрифта для кода
+MAX_FONT_SIZE = 24
+MIN_FONT_SIZE = 10
+
+
+class FontFit(NamedTuple):
+    """
+    Результат подбора размера шрифта.
+    """
+    font_size: int  # Выбранный размер шрифта
+    passes: int  # Количество замеров метрик, понадобившихся для выбора
+    fits: bool  # Помещается ли код в отведённую область (False — взят минимальный размер)
+
 
 def get_default_font():
     """
@@ -29,6 +59,97 @@ def get_default_font():
         return None
 
 
+@lru_cache(maxsize=32)
+def _get_font_manager(font_size: int) -> FontManager:
+    """
+    Возвращает менеджер шрифтов Pygments для заданного размера (тот же шрифт, что у ImageFormatter).
+    Поиск шрифта выполняется один раз на размер.
+    """
+    return FontManager('', font_size)
+
+
+@lru_cache(maxsize=4096)
+def _get_text_width(font_size: int, text: str) -> int:
+    """
+    Возвращает ширину фрагмента текста в пикселях для заданного размера шрифта.
+    """
+    return _get_font_manager(font_size).get_text_size(text)[0]
+
+
+def split_code_lines(tokens) -> list:
+    """
+    Разбивает поток токенов на строки так же, как это делает ImageFormatter:
+    каждая строка — список текстовых фрагментов (по одному на токен).
+
+    :param tokens: Список токенов (тип, значение) от лексера.
+    :return: Список строк, каждая строка — список фрагментов.
+    """
+    lines = [[]]
+    for _, value in tokens:
+        value = value.expandtabs(4)
+        for line in value.splitlines(True):
+            fragment = line.rstrip('\n')
+            if fragment:
+                lines[-1].append(fragment)
+            if line.endswith('\n'):
+                lines.append([])
+    # Последний элемент — хвост после последнего перевода строки: форматтер учитывает его ширину,
+    # но не высоту (лексер добавляет завершающий перевод строки, поэтому обычно он пуст)
+    return lines
+
+
+def measure_code_size(lines: list, font_size: int) -> tuple:
+    """
+    Вычисляет размер изображения с кодом (ширина, высота) для заданного размера шрифта без рендеринга.
+
+    :param lines: Строки кода, полученные из split_code_lines.
+    :param font_size: Размер шрифта.
+    :return: Кортеж (ширина, высота) в пикселях.
+    """
+    _, line_height = _get_font_manager(font_size).get_char_size()
+    width = max((sum(_get_text_width(font_size, fragment) for fragment in line) for line in lines), default=0)
+    return width, line_height * (len(lines) - 1)
+
+
+def fit_code_font_size(lines: list, max_width: int, max_height: int,
+                       min_font_size: int = MIN_FONT_SIZE, max_font_size: int = MAX_FONT_SIZE) -> FontFit:
+    """
+    Подбирает наибольший размер шрифта, при котором код помещается в заданную область.
+    Сначала проверяется максимальный размер (короткий код), затем размер ищется бинарным поиском.
+
+    :param lines: Строки кода, полученные из split_code_lines.
+    :param max_width: Максимальная ширина области с кодом.
+    :param max_height: Максимальная высота области с кодом.
+    :param min_font_size: Минимальный размер шрифта.
+    :param max_font_size: Максимальный размер шрифта.
+    :return: Результат подбора FontFit.
+    """
+    passes = 0
+
+    def fits(font_size: int) -> bool:
+        nonlocal passes
+        passes += 1
+        code_width, code_height = measure_code_size(lines, font_size)
+        return code_width <= max_width and code_height <= max_height
+
+    if fits(max_font_size):
+        return FontFit(max_font_size, passes, True)
+
+    low, high = min_font_size, max_font_size - 1
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        if fits(middle):
+            best = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    if best is None:
+        return FontFit(min_font_size, passes, False)
+    return FontFit(best, passes, True)
+
+
 def generate_console_image(task_text: str, logo_path: str) -> Image.Image:
     """
     Генерирует изображение консоли с подсвеченным кодом задачи и логотипом.
@@ -37,9 +158,20 @@ def generate_console_image(task_text: str, logo_path: str) -> Image.Image:
     :param logo_path: Путь к логотипу.
     :return: Объект изображения PIL.
     """
+    return render_console_image(task_text, logo_path)[0]
+
+
+def render_console_image(task_text: str, logo_path: str) -> Tuple[Image.Image, FontFit]:
+    """
+    Генерирует изображение консоли и возвращает его вместе с результатом подбора шрифта.
+
+    :param task_text: Текст задачи (код).
+    :param logo_path: Путь к логотипу.
+    :return: Объект изображения PIL и FontFit.
+    """
     # Размеры изображения и консольного окна
-    width, height = 800, 500
-    console_width, console_height = 700, 350
+    width, height = IMAGE_SIZE
+    console_width, console_height = CONSOLE_SIZE
 
     # Создаем изображение с фоном светло-синего цвета
     background_color = (173, 216, 230)  # Светло-синий цвет фона
@@ -78,31 +210,32 @@ def generate_console_image(task_text: str, logo_path: str) -> Image.Image:
                       circle_y + 2 * circle_radius),
                      fill=color)
 
-    # Динамическое определение размера шрифта
-    max_font_size = 24
-    min_font_size = 10
-    font_size = max_font_size
+    # Динамическое определение размера шрифта: метрики текста замеряются без рендеринга,
+    # после чего код рендерится ровно один раз
     padding = 20
     code_width = console_width - 2 * padding
     code_height = console_height - 2 * padding - 30  # 30 - примерная высота кнопок
 
-    while font_size >= min_font_size:
-        code_image = highlight(
-            task_text,
-            PythonLexer(),
-            ImageFormatter(
-                font_size=font_size,
-                style=get_style_by_name('monokai'),
-                line_numbers=False,
-                image_pad=0,
-                line_pad=0,
-                background_color=console_color
-            )
+    started_at = time.perf_counter()
+    tokens = list(PythonLexer().get_tokens(task_text))
+    font_fit = fit_code_font_size(split_code_lines(tokens), code_width, code_height)
+
+    code_image = pygments.format(
+        tokens,
+        ImageFormatter(
+            font_size=font_fit.font_size,
+            style=get_style_by_name(CODE_STYLE),
+            line_numbers=False,
+            image_pad=0,
+            line_pad=0,
+            background_color=console_color
         )
-        code_img = Image.open(io.BytesIO(code_image))
-        if code_img.width <= code_width and code_img.height <= code_height:
-            break
-        font_size -= 1
+    )
+    code_img = Image.open(io.BytesIO(code_image))
+    logging.debug(
+        f"Код отрендерен шрифтом {font_fit.font_size} (замеров: {font_fit.passes}, "
+        f"помещается: {font_fit.fits}) за {(time.perf_counter() - started_at) * 1000:.1f} мс"
+    )
 
     # Вставка изображения с кодом
     code_x = console_x0 + padding
@@ -119,7 +252,7 @@ def generate_console_image(task_text: str, logo_path: str) -> Image.Image:
     except FileNotFoundError:
         print(f"Логотип не найден по пути: {logo_path}")
 
-    return image
+    return image, font_fit
 
 
 def save_and_show_image(image: Image.Image, filename: str = "console_image.png"):
@@ -145,34 +278,97 @@ def get_image_bytes(image: Image.Image) -> bytes:
     return output.getvalue()
 
 
+def get_render_cache_key(task_text: str, logo_path: str) -> str:
+    """
+    Вычисляет ключ кэша рендеринга по содержимому: текст задачи, лексер, стиль,
+    логотип (путь, размер и время изменения файла) и геометрия холста.
 
-
-
-def generate_image_name(topic: str) -> str:
+    :param task_text: Текст задачи (код).
+    :param logo_path: Путь к логотипу.
+    :return: Хэш SHA-256 в шестнадцатеричном виде.
     """
-    Генерирует уникальное название для изображения на основе темы и текущей даты.
+    try:
+        logo_stat = os.stat(logo_path)
+        logo_fingerprint = f"{logo_path}:{logo_stat.st_size}:{logo_stat.st_mtime_ns}"
+    except OSError:
+        logo_fingerprint = f"{logo_path}:missing"
+
+    key_parts = [
+        f"v{RENDER_VERSION}",
+        f"{MIN_FONT_SIZE}-{MAX_FONT_SIZE}",
+        PythonLexer.name,
+        CODE_STYLE,
+        logo_fingerprint,
+        f"{IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}",
+        f"{CONSOLE_SIZE[0]}x{CONSOLE_SIZE[1]}",
+        task_text,
+    ]
+    return hashlib.sha256("\x00".join(key_parts).encode('utf-8')).hexdigest()
+
+
+def render_png_bytes(task_text: str, logo_path: str) -> Tuple[bytes, FontFit]:
+    """
+    Рендерит изображение консоли и кодирует его в PNG без обращения к кэшу.
+    Функция модульного уровня, чтобы её можно было выполнять в пуле процессов.
 
-    :param topic: Тема вопроса.
-    :return: Сгенерированное имя файла.
+    :param task_text: Текст задачи (код).
+    :param logo_path: Путь к логотипу.
+    :return: Байты изображения в формате PNG и результат подбора шрифта (для статистики рендеринга).
     """
-    # Текущая дата
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    image, font_fit = render_console_image(task_text, logo_path)
+    return get_image_bytes(image), font_fit
+
 
-    # Формируем название файла: тема и дата
-    image_name = f"{topic}_{timestamp}.png"
-    return image_name
+def render_console_image_bytes(task_text: str, logo_path: str) -> bytes:
+    """
+    Возвращает PNG-байты изображения консоли, используя кэш рендеринга.
+    Повторный рендер одного и того же кода (предпросмотр, подтверждение, повторный импорт)
+    не выполняется.
 
+    :param task_text: Текст задачи (код).
+    :param logo_path: Путь к логотипу.
+    :return: Байты изображения в формате PNG.
+    """
+    key = get_render_cache_key(task_text, logo_path)
+    image_bytes = render_cache.get(key)
+    if image_bytes is None:
+        image_bytes, _ = render_png_bytes(task_text, logo_path)
+        render_cache.put(key, image_bytes)
+    return image_bytes
 
 
 
 
 
+def generate_image_name(topic: str) -> str:
+    """
+    Генерирует уникальное название для изображения на основе темы.
 
-def generate_image_name(topic):
+    :param topic: Тема вопроса.
+    :return: Сгенерированное имя файла.
+    """
     unique_id = uuid4().hex
     return f"{topic}_{unique_id}.png"
 
 
+def get_content_hash(image_bytes: bytes) -> str:
+    """
+    Возвращает хэш SHA-256 содержимого изображения.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def generate_content_image_name(content_hash: str) -> str:
+    """
+    Генерирует имя изображения по хэшу его содержимого: одинаковые изображения получают
+    один и тот же ключ в S3 и загружаются только один раз.
+
+    :param content_hash: Хэш SHA-256 PNG-байтов изображения.
+    :return: Имя файла.
+    """
+    return f"images/{content_hash}.png"
+
+
 
 
 
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from bot.services.image_service import get_content_hash, generate_content_image_name
+from bot.services.s3_service import s3_uploader
+from config import IMAGE_INDEX_CACHE_SIZE
+from database.database import async_sessionmaker
+from database.models import ImageObject
+
+
+@dataclass
+class StoredImage:
+    """
+    Результат сохранения изображения в хранилище.
+    """
+    url: Optional[str]
+    content_hash: str
+    size: int
+    uploaded: bool  # False — изображение уже было в S3, загрузка пропущена
+
+
+class ImageStore:
+    """
+    Хранилище изображений с адресацией по содержимому.
+
+    Ключ объекта в S3 вычисляется из хэша PNG-байтов, а уже загруженные хэши учитываются
+    в таблице image_objects. Недавно встречавшиеся хэши кэшируются в памяти (не больше cache_size),
+    остальные ищутся в таблице. Повторная загрузка того же изображения обходится без обращения к S3.
+    """
+
+    def __init__(self, session_maker, cache_size: int = 10000):
+        """
+        :param session_maker: Фабрика сессий базы данных для работы с индексом изображений.
+        :param cache_size: Сколько хэшей уже загруженных изображений держать в памяти.
+        """
+        self.session_maker = session_maker
+        self.cache_size = cache_size
+        self._known = OrderedDict()  # content_hash -> url, давно не использованные вытесняются
+        self._inflight = {}  # content_hash -> Future с URL: поиск в индексе и загрузка выполняются один раз
+
+        self.uploaded = 0
+        self.skipped = 0
+        self.bytes_saved = 0
+
+    async def store(self, image_bytes: bytes) -> StoredImage:
+        """
+        Сохраняет изображение в S3, если такого содержимого там ещё нет.
+
+        :param image_bytes: PNG-байты изображения.
+        :return: Результат сохранения (URL равен None при ошибке загрузки).
+        """
+        content_hash = get_content_hash(image_bytes)
+
+        url = self._get_known(content_hash)
+        if url:
+            return self._skipped(content_hash, url, len(image_bytes))
+
+        inflight = self._inflight.get(content_hash)
+        if inflight is not None:
+            # То же изображение уже ищется в индексе или загружается — дожидаемся результата
+            url = await asyncio.shield(inflight)
+            return self._skipped(content_hash, url, len(image_bytes))
+
+        # Future регистрируется до первого await, иначе одновременные вызовы с одинаковым
+        # изображением разминутся и загрузят его дважды
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[content_hash] = future
+        uploaded = False
+        try:
+            url = await self._lookup(content_hash)
+            if not url:
+                url = await self._upload(content_hash, image_bytes)
+                uploaded = bool(url)
+            future.set_result(url)
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            self._inflight.pop(content_hash, None)
+
+        if not uploaded:
+            return self._skipped(content_hash, url, len(image_bytes))
+        self.uploaded += 1
+        return StoredImage(url=url, content_hash=content_hash, size=len(image_bytes), uploaded=True)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику хранилища с момента запуска.
+        """
+        return {
+            'known': len(self._known),
+            'uploaded': self.uploaded,
+            'skipped': self.skipped,
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def _skipped(self, content_hash: str, url: Optional[str], size: int) -> StoredImage:
+        if url:
+            self.skipped += 1
+            self.bytes_saved += size
+        return StoredImage(url=url, content_hash=content_hash, size=size, uploaded=False)
+
+    def _get_known(self, content_hash: str) -> Optional[str]:
+        url = self._known.get(content_hash)
+        if url is not None:
+            self._known.move_to_end(content_hash)
+        return url
+
+    def _remember(self, content_hash: str, url: str) -> None:
+        self._known[content_hash] = url
+        self._known.move_to_end(content_hash)
+        while len(self._known) > self.cache_size:
+            self._known.popitem(last=False)
+
+    async def _lookup(self, content_hash: str) -> Optional[str]:
+        try:
+            async with self.session_maker() as session:
+                url = await session.scalar(select(ImageObject.url).where(ImageObject.content_hash == content_hash))
+        except Exception as e:
+            logging.error(f"Ошибка при поиске изображения {content_hash} в индексе: {e}")
+            return None
+        if url:
+            self._remember(content_hash, url)
+        return url
+
+    async def _upload(self, content_hash: str, image_bytes: bytes) -> Optional[str]:
+        key = generate_content_image_name(content_hash)
+        url = await s3_uploader.upload(image_bytes, key)
+        if not url:
+            return None
+
+        try:
+            async with self.session_maker() as session:
+                await session.execute(
+                    insert(ImageObject)
+                    .values(content_hash=content_hash, key=key, url=url, size=len(image_bytes))
+                    .on_conflict_do_nothing(index_elements=[ImageObject.content_hash])
+                )
+                await session.commit()
+        except Exception as e:
+            # Объект уже в S3; без записи в индексе он просто будет загружен повторно в следующий раз
+            logging.error(f"Ошибка при сохранении изображения {content_hash} в индекс: {e}")
+
+        self._remember(content_hash, url)
+        logging.info(f"Изображение загружено в S3 по ключу {key}")
+        return url
+
+
+# Общее хранилище изображений
+image_store = ImageStore(async_sessionmaker, cache_size=IMAGE_INDEX_CACHE_SIZE)
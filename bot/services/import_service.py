@@ -0,0 +1,386 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.services.image_store import image_store
+from bot.services.render_service import render_service
+from config import IMPORT_RENDER_CONCURRENCY, IMPORT_UPLOAD_CONCURRENCY, IMPORT_DB_BATCH_SIZE, \
+    IMPORT_INSERT_CHUNK_SIZE, IMPORT_PROGRESS_INTERVAL
+from database.bulk import bulk_insert_tasks
+
+
+LOGO_PATH = "assets/logo.png"
+
+
+class TaskValidationError(ValueError):
+    """
+    Задача из JSON-файла не прошла проверку.
+    """
+
+
+@dataclass
+class StageStats:
+    """
+    Статистика одного этапа конвейера импорта.
+    """
+    name: str
+    processed: int = 0
+    failed: int = 0
+    busy_time: float = 0.0  # Суммарное время работы этапа по всем задачам (сек.)
+
+    def summary(self) -> str:
+        average = self.busy_time / self.processed * 1000 if self.processed else 0.0
+        return (f"{self.name}: {self.processed} шт., ошибок {self.failed}, "
+                f"всего {self.busy_time:.1f} с, в среднем {average:.0f} мс")
+
+
+@dataclass
+class ImportResult:
+    """
+    Итог (или текущее состояние) импорта задач.
+    """
+    total: Optional[int] = None  # Количество задач в файле, если известно заранее
+    received: int = 0
+    saved: int = 0
+    errors: list = field(default_factory=list)  # Список (номер задачи, описание ошибки)
+    last_task_id: Optional[int] = None
+    source_error: Optional[str] = None  # Ошибка разбора файла, остановившая чтение задач
+    uploads_skipped: int = 0  # Изображения, которые уже были в S3 и не загружались повторно
+    bytes_saved: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+    stages: dict = field(default_factory=lambda: {
+        name: StageStats(name) for name in ('validate', 'render', 'upload', 'db')
+    })
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """
+        Скорость импорта (сохранённых задач в секунду).
+        """
+        return self.saved / self.elapsed if self.elapsed > 0 else 0.0
+
+    def progress_text(self) -> str:
+        total = self.total if self.total is not None else '?'
+        return (f"Импорт задач: сохранено {self.saved} из {total}, "
+                f"ошибок {len(self.errors)}, {self.rate:.1f} задач/с")
+
+    def summary_text(self) -> str:
+        lines = [
+            f"Загружено задач: {self.saved} из {self.received} за {self.elapsed:.1f} с ({self.rate:.1f} задач/с)",
+            f"Ошибок: {len(self.errors)}",
+            f"Пропущено повторных загрузок изображений: {self.uploads_skipped} "
+            f"({self.bytes_saved / 1024:.0f} КБ)",
+            "",
+            "Время по этапам:",
+        ]
+        lines.extend(stage.summary() for stage in self.stages.values())
+        if self.source_error:
+            lines.extend(["", f"Чтение файла остановлено из-за ошибки: {self.source_error}"])
+        return "\n".join(lines)
+
+    def errors_report(self) -> str:
+        """
+        Отчёт об ошибках по каждой задаче (одна строка на задачу).
+        """
+        return "\n".join(f"Задача №{index}: {error}" for index, error in self.errors)
+
+
+def validate_task(raw_task) -> dict:
+    """
+    Проверяет задачу из JSON-файла и готовит поля для сохранения (язык по умолчанию).
+
+    :param raw_task: Задача в том виде, в котором она пришла в файле.
+    :return: Словарь полей модели Task (без image_url); в ключе 'translations' — поля TaskTranslation
+        для остальных языков задачи.
+    :raises TaskValidationError: Если обязательные поля отсутствуют или некорректны.
+    """
+    if not isinstance(raw_task, dict):
+        raise TaskValidationError("задача должна быть объектом")
+
+    for key in ('topic', 'question', 'correct_answer', 'wrong_answers', 'resource_link'):
+        if key not in raw_task:
+            raise TaskValidationError(f"отсутствует поле '{key}'")
+
+    default_language = raw_task.get('default_language', 'ru')
+
+    def localized(key, default):
+        value = raw_task.get(key) or {}
+        if not isinstance(value, dict):
+            raise TaskValidationError(f"поле '{key}' должно быть объектом с переводами")
+        return value.get(default_language, default)
+
+    question = localized('question', '')
+    correct_answer = localized('correct_answer', '')
+    wrong_answers = localized('wrong_answers', [])
+
+    if not question:
+        raise TaskValidationError(f"нет текста вопроса на языке '{default_language}'")
+    if not correct_answer:
+        raise TaskValidationError(f"нет правильного ответа на языке '{default_language}'")
+    if not isinstance(wrong_answers, list) or not wrong_answers:
+        raise TaskValidationError(f"нет неправильных ответов на языке '{default_language}'")
+
+    # Переводы на остальные языки, для которых есть вопрос и правильный ответ
+    translations = []
+    question_translations = raw_task['question'] if isinstance(raw_task['question'], dict) else {}
+    for language in question_translations:
+        if language == default_language:
+            continue
+        translation = get_translation(raw_task, language)
+        if translation:
+            translations.append(translation)
+
+    return {
+        'topic': raw_task['topic'],
+        'subtopic': raw_task.get('subtopic', ''),
+        'question': question,
+        'correct_answer': correct_answer,
+        'wrong_answers': wrong_answers,
+        'explanation': localized('explanation', ''),
+        'resource_link': raw_task['resource_link'],
+        'short_description': localized('short_description', ''),
+        'default_language': default_language,
+        'language': raw_task.get('language', default_language),
+        'translations': translations,
+    }
+
+
+def get_translation(raw_task: dict, language: str) -> Optional[dict]:
+    """
+    Готовит поля TaskTranslation для языка или возвращает None, если перевод неполный.
+    """
+    def localized(key, default):
+        value = raw_task.get(key)
+        return value.get(language, default) if isinstance(value, dict) else default
+
+    question = localized('question', '')
+    correct_answer = localized('correct_answer', '')
+    wrong_answers = localized('wrong_answers', [])
+    if not question or not correct_answer or not isinstance(wrong_answers, list) or not wrong_answers:
+        return None
+
+    return {
+        'language': language,
+        'subtopic': raw_task.get('subtopic', ''),
+        'question': question,
+        'answers': wrong_answers + [correct_answer],
+        'correct_answer': correct_answer,
+        'wrong_answers': wrong_answers,
+        'explanation': localized('explanation', ''),
+    }
+
+
+class TaskImportPipeline:
+    """
+    Конвейер массового импорта задач: проверка → рендеринг (пул процессов) →
+    загрузка в S3 без повторов одинаковых изображений (ограниченное число параллельных загрузок) →
+    пакетная запись в БД многострочными INSERT (задачи и их переводы).
+
+    Этапы связаны ограниченными очередями, у каждого этапа свой лимит параллелизма,
+    поэтому медленный этап притормаживает предыдущие, а не накапливает задачи в памяти.
+    """
+
+    def __init__(self, session: AsyncSession,
+                 render_concurrency: int = IMPORT_RENDER_CONCURRENCY,
+                 upload_concurrency: int = IMPORT_UPLOAD_CONCURRENCY,
+                 db_batch_size: int = IMPORT_DB_BATCH_SIZE,
+                 insert_chunk_size: int = IMPORT_INSERT_CHUNK_SIZE,
+                 progress_callback: Optional[Callable[[ImportResult], Awaitable[None]]] = None,
+                 progress_interval: float = IMPORT_PROGRESS_INTERVAL):
+        """
+        :param session: Сессия базы данных для записи задач.
+        :param render_concurrency: Количество одновременных рендеров.
+        :param upload_concurrency: Количество одновременных загрузок в S3.
+        :param db_batch_size: Количество задач в одной транзакции записи.
+        :param insert_chunk_size: Максимум строк в одном многострочном INSERT.
+        :param progress_callback: Корутина, вызываемая периодически с текущим состоянием импорта.
+        :param progress_interval: Интервал вызова progress_callback в секундах.
+        """
+        self.session = session
+        self.render_concurrency = max(1, render_concurrency)
+        self.upload_concurrency = max(1, upload_concurrency)
+        self.db_batch_size = max(1, db_batch_size)
+        self.insert_chunk_size = max(1, insert_chunk_size)
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.result = ImportResult()
+
+    async def run(self, raw_tasks: Iterable, total: Optional[int] = None) -> ImportResult:
+        """
+        Прогоняет задачи через все этапы конвейера.
+
+        :param raw_tasks: Итерируемый источник задач в формате JSON-файла (список или потоковый разбор).
+        :param total: Общее количество задач, если известно (для отображения прогресса).
+        :return: Итог импорта.
+        """
+        self.result = ImportResult(total=total)
+
+        render_queue = asyncio.Queue(maxsize=self.render_concurrency * 2)
+        upload_queue = asyncio.Queue(maxsize=self.upload_concurrency * 2)
+        db_queue = asyncio.Queue(maxsize=self.db_batch_size * 2)
+
+        render_workers = [asyncio.create_task(self._render_worker(render_queue, upload_queue))
+                          for _ in range(self.render_concurrency)]
+        upload_workers = [asyncio.create_task(self._upload_worker(upload_queue, db_queue))
+                          for _ in range(self.upload_concurrency)]
+        db_writer = asyncio.create_task(self._db_writer(db_queue))
+        reporter = asyncio.create_task(self._report_progress()) if self.progress_callback else None
+
+        try:
+            await self._produce(raw_tasks, render_queue)
+
+            # Останавливаем этапы по очереди, чтобы каждый успел обработать всё, что осталось
+            for _ in render_workers:
+                await render_queue.put(None)
+            await asyncio.gather(*render_workers)
+
+            for _ in upload_workers:
+                await upload_queue.put(None)
+            await asyncio.gather(*upload_workers)
+
+            await db_queue.put(None)
+            await db_writer
+        except BaseException:
+            for worker in render_workers + upload_workers + [db_writer]:
+                worker.cancel()
+            raise
+        finally:
+            self.result.finished_at = time.perf_counter()
+            if reporter:
+                reporter.cancel()
+
+        logging.info(self.result.summary_text())
+        return self.result
+
+    async def _produce(self, raw_tasks: Iterable, render_queue: asyncio.Queue):
+        stats = self.result.stages['validate']
+        source = iter(raw_tasks)
+        index = 0
+        while True:
+            # Источник может быть потоковым разбором файла: ошибка разбора останавливает чтение,
+            # но уже прочитанные задачи доводятся до конца
+            try:
+                raw_task = next(source)
+            except StopIteration:
+                break
+            except ValueError as e:
+                self.result.source_error = str(e)
+                self._add_error(index + 1, f"ошибка разбора файла, чтение остановлено: {e}")
+                break
+
+            index += 1
+            self.result.received += 1
+            started_at = time.perf_counter()
+            try:
+                row = validate_task(raw_task)
+            except TaskValidationError as e:
+                stats.failed += 1
+                self._add_error(index, f"некорректная задача: {e}")
+                continue
+            finally:
+                stats.busy_time += time.perf_counter() - started_at
+            stats.processed += 1
+            await render_queue.put({'index': index, 'row': row})
+
+    async def _render_worker(self, render_queue: asyncio.Queue, upload_queue: asyncio.Queue):
+        stats = self.result.stages['render']
+        while True:
+            item = await render_queue.get()
+            if item is None:
+                break
+
+            started_at = time.perf_counter()
+            try:
+                item['image_bytes'] = await render_service.render(item['row']['question'], LOGO_PATH)
+            except Exception as e:
+                stats.failed += 1
+                self._add_error(item['index'], f"ошибка рендеринга: {e}")
+                continue
+            finally:
+                stats.busy_time += time.perf_counter() - started_at
+            stats.processed += 1
+            await upload_queue.put(item)
+
+    async def _upload_worker(self, upload_queue: asyncio.Queue, db_queue: asyncio.Queue):
+        stats = self.result.stages['upload']
+        while True:
+            item = await upload_queue.get()
+            if item is None:
+                break
+
+            started_at = time.perf_counter()
+            try:
+                stored = await image_store.store(item.pop('image_bytes'))
+                image_url = stored.url
+                if image_url and not stored.uploaded:
+                    self.result.uploads_skipped += 1
+                    self.result.bytes_saved += stored.size
+            except Exception as e:
+                image_url = None
+                logging.error(f"Ошибка при загрузке изображения задачи №{item['index']}: {e}")
+            finally:
+                stats.busy_time += time.perf_counter() - started_at
+
+            if not image_url:
+                stats.failed += 1
+                self._add_error(item['index'], "ошибка загрузки изображения в S3")
+                continue
+            stats.processed += 1
+            item['row']['image_url'] = image_url
+            await db_queue.put(item)
+
+    async def _db_writer(self, db_queue: asyncio.Queue):
+        batch = []
+        while True:
+            item = await db_queue.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) >= self.db_batch_size:
+                await self._write_batch(batch)
+                batch = []
+        if batch:
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: list):
+        stats = self.result.stages['db']
+        started_at = time.perf_counter()
+        try:
+            task_ids = await bulk_insert_tasks(self.session, [item['row'] for item in batch], self.insert_chunk_size)
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            logging.error(f"Ошибка при сохранении пакета задач в базу данных: {e}")
+            stats.failed += len(batch)
+            for item in batch:
+                self._add_error(item['index'], f"ошибка сохранения в базу данных: {e}")
+            return
+        finally:
+            stats.busy_time += time.perf_counter() - started_at
+
+        stats.processed += len(batch)
+        self.result.saved += len(batch)
+        last_task_id = max(task_ids)
+        self.result.last_task_id = max(self.result.last_task_id or 0, last_task_id)
+        logging.info(f"Сохранён пакет из {len(batch)} задач (всего сохранено: {self.result.saved}).")
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await self.progress_callback(self.result)
+            except Exception as e:
+                logging.warning(f"Не удалось обновить прогресс импорта: {e}")
+
+    def _add_error(self, index: int, message: str):
+        logging.warning(f"Задача №{index}: {message}")
+        self.result.errors.append((index, message))
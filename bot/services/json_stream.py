@@ -0,0 +1,143 @@
+import io
+import json
+from typing import BinaryIO, Iterator
+
+
+class JsonStructureError(ValueError):
+    """
+    Структура JSON-документа не соответствует ожидаемой.
+    """
+
+
+class JsonArrayStream:
+    """
+    Потоковый разбор массива, лежащего под ключом верхнеуровневого JSON-объекта
+    (например, {"tasks": [...]}).
+
+    Элементы массива разбираются и отдаются по одному, в памяти одновременно находится
+    только текущий элемент и буфер чтения, независимо от размера файла.
+    """
+
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, stream: BinaryIO, key: str, chunk_size: int = 64 * 1024):
+        """
+        :param stream: Двоичный поток с JSON-документом.
+        :param key: Ключ верхнеуровневого объекта, под которым лежит массив.
+        :param chunk_size: Размер блока чтения в байтах.
+        """
+        self.reader = io.TextIOWrapper(stream, encoding='utf-8-sig')
+        self.key = key
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self) -> Iterator:
+        self._expect('{')
+        while True:
+            if self._peek() == '}':
+                raise JsonStructureError(f"В JSON-объекте нет ключа '{self.key}'")
+
+            key = self._decode_value()
+            if not isinstance(key, str):
+                raise JsonStructureError("Ключ JSON-объекта должен быть строкой")
+            self._expect(':')
+
+            if key == self.key:
+                yield from self._iter_array()
+                return
+
+            # Значения других ключей разбираются и отбрасываются
+            self._decode_value()
+            if self._next_char() != ',':
+                raise JsonStructureError(f"В JSON-объекте нет ключа '{self.key}'")
+
+    def _iter_array(self) -> Iterator:
+        if self._peek() != '[':
+            raise JsonStructureError(f"Значение ключа '{self.key}' должно быть массивом")
+        self._next_char()
+
+        if self._peek() == ']':
+            self._next_char()
+            return
+
+        while True:
+            yield self._decode_value()
+            char = self._next_char()
+            if char == ']':
+                return
+            if char != ',':
+                raise json.JSONDecodeError("Ожидалась ',' или ']'", self.buffer, self.pos)
+
+    def _fill(self) -> bool:
+        """
+        Дочитывает очередной блок в буфер, отбрасывая уже разобранную часть.
+        """
+        if self.eof:
+            return False
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.reader.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return
+
+    def _peek(self) -> str:
+        self._skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise json.JSONDecodeError("Неожиданный конец файла", self.buffer, self.pos)
+        return self.buffer[self.pos]
+
+    def _next_char(self) -> str:
+        char = self._peek()
+        self.pos += 1
+        return char
+
+    def _expect(self, expected: str):
+        char = self._next_char()
+        if char != expected:
+            if expected == '{':
+                raise JsonStructureError("Ожидался JSON-объект")
+            raise json.JSONDecodeError(f"Ожидался символ '{expected}'", self.buffer, self.pos - 1)
+
+    def _decode_value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Значение могло не поместиться в буфер целиком — дочитываем и пробуем снова
+                if self._fill():
+                    continue
+                raise
+            # Число на границе буфера может быть прочитано не полностью
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(stream: BinaryIO, key: str, chunk_size: int = 64 * 1024) -> Iterator:
+    """
+    Потоково перебирает элементы массива под ключом key верхнеуровневого JSON-объекта.
+
+    :param stream: Двоичный поток с JSON-документом.
+    :param key: Ключ массива (например, 'tasks').
+    :param chunk_size: Размер блока чтения в байтах.
+    :return: Итератор по элементам массива.
+    :raises JsonStructureError: Если документ не является объектом с массивом под ключом key.
+    :raises json.JSONDecodeError: Если документ содержит синтаксическую ошибку.
+    """
+    return iter(JsonArrayStream(stream, key, chunk_size))
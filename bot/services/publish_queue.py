@@ -0,0 +1,506 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update, or_, func, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from bot.services.telegram_service import send_task_photo
+from config import PUBLISH_WORKERS, PUBLISH_MAX_ATTEMPTS, PUBLISH_RETRY_DELAY, PUBLISH_POLL_INTERVAL
+from database.database import async_sessionmaker, poll_answer_buffer
+from database.models import PublishJob, Task
+
+
+# Словари для различных фраз на нескольких языках
+DONT_KNOW_OPTIONS = {
+    'ru': "Я не знаю, но хочу узнать",
+    'en': "I don't know, but I want to learn",
+    'es': "No lo sé, pero quiero aprender",
+    'tr': "Bilmiyorum, ama öğrenmek istiyorum"
+}
+
+LEARN_MORE_TEXT = {
+    'ru': "Узнать подробнее",
+    'en': "Learn more",
+    'es': "Saber más",
+    'tr': "Daha fazla öğren"
+}
+
+POLL_TEXT = {
+    'ru': "Каким будет вывод?",
+    'en': "What will be the output?",
+    'es': "¿Cuál será el resultado?",
+    'tr': "Çıktı ne olacak?"
+}
+
+# Состояния задания: последний успешно отправленный шаг публикации
+PENDING = 'pending'
+PHOTO_SENT = 'photo_sent'
+POLL_TEXT_SENT = 'poll_text_sent'
+POLL_SENT = 'poll_sent'
+DONE = 'done'
+
+# Незавершённые задания. Константа встраивается в текст запроса, а не передаётся параметром:
+# иначе в обобщённом плане подготовленного запроса PostgreSQL не может применить частичный
+# индекс ix_publish_jobs_ready (его условие state != 'done')
+NOT_DONE = PublishJob.state != literal_column(f"'{DONE}'")
+
+# Ошибки, которые не исправятся повтором (бота удалили из группы, чат не найден и т.п.)
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError)
+
+
+async def send_intro_photo(bot: Bot, chat_id: int, task: Task) -> None:
+    """
+    Отправляет картинку задачи с темой и подтемой.
+    """
+    intro_text = f"Тема: {task.topic}\nПодтема: {task.subtopic or 'Без подтемы'}"
+    await send_task_photo(bot, chat_id=chat_id, task=task, caption=intro_text)
+    logging.info(f"Сообщение с картинкой отправлено в группу {chat_id}: {task.image_url}")
+
+
+async def send_poll_text(bot: Bot, chat_id: int, task: Task) -> None:
+    """
+    Отправляет текст перед опросом на языке задачи.
+    """
+    await bot.send_message(chat_id=chat_id, text=POLL_TEXT.get(task.language, "Каким будет вывод?"))
+
+
+async def send_quiz_poll(bot: Bot, chat_id: int, task: Task) -> None:
+    """
+    Отправляет опрос: перемешанные варианты ответов и вариант «Я не знаю» в конце.
+    Запоминает, к какой задаче относится опрос.
+    """
+    options = task.wrong_answers + [task.correct_answer]
+    random.shuffle(options)
+    options.append(DONT_KNOW_OPTIONS.get(task.language, "Я не знаю, но хочу узнать"))
+
+    correct_option_id = options.index(task.correct_answer)
+    message = await bot.send_poll(
+        chat_id=chat_id,
+        question=task.question,
+        options=options,
+        type="quiz",
+        correct_option_id=correct_option_id,
+        explanation=task.explanation,
+        is_anonymous=False
+    )
+    logging.info(f"Опрос опубликован в группе {chat_id}: {task.question}")
+
+    # По poll_id ответы на опрос засчитываются в статистику задачи
+    await poll_answer_buffer.register_poll(message.poll.id, task, chat_id, correct_option_id)
+
+
+async def send_learn_more_button(bot: Bot, chat_id: int, task: Task) -> None:
+    """
+    Отправляет кнопку «Узнать подробнее» со ссылкой на ресурс задачи.
+    """
+    if not task.resource_link:
+        return
+    learn_more_text = LEARN_MORE_TEXT.get(task.language, "Узнать подробнее")
+    await bot.send_message(
+        chat_id=chat_id,
+        text="Узнать подробнее:",
+        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
+            [types.InlineKeyboardButton(text=learn_more_text, url=task.resource_link)]
+        ])
+    )
+    logging.info(f"Кнопка 'Узнать больше' отправлена в группу {chat_id}.")
+
+
+# Шаги публикации: (состояние до шага, отправка, состояние после шага)
+PUBLISH_STEPS = (
+    (PENDING, send_intro_photo, PHOTO_SENT),
+    (PHOTO_SENT, send_poll_text, POLL_TEXT_SENT),
+    (POLL_TEXT_SENT, send_quiz_poll, POLL_SENT),
+    (POLL_SENT, send_learn_more_button, DONE),
+)
+
+
+def get_ready_condition(now: datetime):
+    """
+    Условие готовности задания к публикации (совпадает с условием частичного индекса ix_publish_jobs_ready).
+    """
+    return (
+        NOT_DONE,
+        PublishJob.failed.is_(False),
+        PublishJob.next_attempt_at <= now,
+        or_(PublishJob.locked_until.is_(None), PublishJob.locked_until < now)
+    )
+
+
+def get_ready_chats_query(now: datetime):
+    """
+    Запрос групп, в которых есть готовые к публикации задания, в порядке очереди.
+    """
+    return (
+        select(PublishJob.chat_id)
+        .where(*get_ready_condition(now))
+        .group_by(PublishJob.chat_id)
+        .order_by(func.min(PublishJob.id))
+    )
+
+
+def get_claim_job_query(chat_id: int, now: datetime):
+    """
+    Запрос следующего готового задания группы с блокировкой строки.
+    """
+    return (
+        select(PublishJob.id)
+        .where(PublishJob.chat_id == chat_id, *get_ready_condition(now))
+        .order_by(PublishJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+
+
+def get_enqueue_query(jobs: Iterable[dict], now: datetime):
+    """
+    Многострочная постановка публикаций в очередь: jobs — словари с task_id и chat_id
+    (пары не должны повторяться внутри одного запроса).
+
+    Существующее активное или выполненное задание той же пары (задача, группа) не меняется,
+    задание с исчерпанными попытками возобновляется.
+    """
+    stmt = insert(PublishJob).values([
+        {'task_id': job['task_id'], 'chat_id': job['chat_id'], 'next_attempt_at': now} for job in jobs
+    ])
+    return stmt.on_conflict_do_update(
+        constraint='uq_publish_jobs_task_chat',
+        set_={'failed': False, 'attempts': 0, 'next_attempt_at': now, 'updated_at': now},
+        where=PublishJob.failed.is_(True)
+    )
+
+
+class PublishQueue:
+    """
+    Очередь публикации задач в группы, хранящаяся в базе данных (таблица publish_jobs).
+
+    Одна строка — одна пара (задача, группа). После каждого отправленного сообщения состояние
+    задания сохраняется, поэтому после ошибки, RetryAfter или перезапуска бота публикация
+    продолжается с невыполненного шага, а уже отправленные сообщения не дублируются.
+
+    Задания раскладываются по «полосам» — по одной на группу. Внутри полосы задачи публикуются
+    последовательно (сообщения разных задач в группе не перемешиваются), а разные группы
+    публикуются одновременно: у каждой свой лимит Telegram, общий лимит бота соблюдает
+    ограничитель исходящих сообщений. Блокировка FOR UPDATE SKIP LOCKED не даёт двум
+    полосам взять одно задание.
+    """
+
+    def __init__(self, session_maker, workers: int = 4, max_attempts: int = 5, retry_delay: float = 30,
+                 poll_interval: float = 5, lease: float = 300):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param workers: Максимум групп, в которые публикация идёт одновременно.
+        :param max_attempts: Попыток на задание, после которых оно помечается как failed.
+        :param retry_delay: Базовая задержка повтора после ошибки (удваивается с каждой попыткой).
+        :param poll_interval: Как часто очередь проверяется на новые задания (сек.).
+        :param lease: На сколько секунд полоса захватывает задание.
+        """
+        self.session_maker = session_maker
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+
+        self._bot: Optional[Bot] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._lanes: Dict[int, asyncio.Task] = {}  # chat_id -> полоса публикации
+        self._wakeup: Optional[asyncio.Event] = None
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+
+        self.published = 0
+        self.failed = 0
+        self.retried = 0
+        self.resumed = 0
+
+    async def start(self, bot: Bot) -> None:
+        """
+        Запускает диспетчер полос. Захваты заданий, оставшиеся от предыдущего запуска, снимаются,
+        и прерванные публикации продолжаются с того шага, на котором остановились.
+        """
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+
+        async with self.session_maker() as session:
+            await session.execute(
+                update(PublishJob)
+                .where(NOT_DONE, PublishJob.locked_until.is_not(None))
+                .values(locked_until=None)
+            )
+            await session.commit()
+
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logging.info(f"Очередь публикации запущена: до {self.workers} групп одновременно.")
+
+    async def shutdown(self) -> None:
+        """
+        Останавливает диспетчер и полосы. Незавершённые задания остаются в базе и будут продолжены
+        при следующем запуске.
+        """
+        tasks = list(self._lanes.values())
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        self._lanes = {}
+
+    async def enqueue(self, task_id: int, chat_id: int) -> int:
+        """
+        Ставит публикацию задачи в группу в очередь.
+
+        Повторная постановка той же пары (задача, группа) не создаёт дубликат: активное или уже
+        выполненное задание остаётся как есть, а задание с исчерпанными попытками возобновляется
+        с шага, на котором остановилось.
+
+        :param task_id: ID задачи.
+        :param chat_id: Telegram ID группы.
+        :return: ID задания.
+        """
+        stmt = get_enqueue_query([{'task_id': task_id, 'chat_id': chat_id}], datetime.utcnow()).returning(PublishJob.id)
+
+        async with self.session_maker() as session:
+            job_id = await session.scalar(stmt)
+            if job_id is None:
+                job_id = await session.scalar(
+                    select(PublishJob.id).where(PublishJob.task_id == task_id, PublishJob.chat_id == chat_id)
+                )
+            await session.commit()
+
+        self.notify()
+        return job_id
+
+    async def enqueue_many(self, jobs: List[Tuple[int, int]]) -> List[int]:
+        """
+        Ставит в очередь пакет публикаций одним INSERT (правила повторной постановки — как у enqueue).
+
+        :param jobs: Пары (ID задачи, Telegram ID группы), без повторов.
+        :return: ID заданий пакета.
+        """
+        if not jobs:
+            return []
+
+        async with self.session_maker() as session:
+            await session.execute(
+                get_enqueue_query([{'task_id': task_id, 'chat_id': chat_id} for task_id, chat_id in jobs],
+                                  datetime.utcnow())
+            )
+            # ID нужны и для уже существовавших заданий, которые INSERT не вернул бы
+            result = await session.execute(
+                select(PublishJob.id).where(tuple_(PublishJob.task_id, PublishJob.chat_id).in_(jobs))
+            )
+            job_ids = list(result.scalars())
+            await session.commit()
+
+        self.notify()
+        return job_ids
+
+    def notify(self) -> None:
+        """
+        Будит диспетчер очереди после того, как задания были добавлены в publish_jobs напрямую
+        (например, планировщиком в своей транзакции через get_enqueue_query).
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(self, job_id: int, timeout: Optional[float] = None) -> Optional[bool]:
+        """
+        Дожидается завершения задания.
+
+        :return: True — задача опубликована, False — попытки исчерпаны, None — не завершилось за timeout.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+
+        # Задание могло завершиться до регистрации ожидания
+        async with self.session_maker() as session:
+            job = await session.get(PublishJob, job_id)
+        if job is None or job.state == DONE or job.failed:
+            self._resolve(job_id, job is not None and job.state == DONE)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    async def wait_many(self, job_ids: Iterable[int]) -> int:
+        """
+        Дожидается завершения всех заданий и возвращает количество опубликованных.
+        """
+        results = await asyncio.gather(*(self.wait(job_id) for job_id in job_ids))
+        return sum(1 for result in results if result)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику очереди с момента запуска.
+        """
+        return {
+            'lanes': len(self._lanes),
+            'published': self.published,
+            'failed': self.failed,
+            'retried': self.retried,
+            'resumed': self.resumed,
+        }
+
+    async def _dispatch(self) -> None:
+        # Открывает полосы для групп, в которых есть готовые к публикации задания
+        while True:
+            try:
+                if len(self._lanes) < self.workers:
+                    for chat_id in await self._ready_chats():
+                        if len(self._lanes) >= self.workers:
+                            break
+                        if chat_id not in self._lanes:
+                            self._lanes[chat_id] = asyncio.create_task(self._lane(chat_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка при выборке групп для публикации: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _lane(self, chat_id: int) -> None:
+        # Публикует задания одной группы по очереди, пока готовые задания не закончатся
+        published = 0
+        try:
+            while True:
+                try:
+                    job_id = await self._claim(chat_id)
+                except Exception as e:
+                    logging.error(f"Полоса публикации группы {chat_id}: ошибка при выборке задания: {e}")
+                    break
+                if job_id is None:
+                    break
+                if await self._process(job_id):
+                    published += 1
+        finally:
+            self._lanes.pop(chat_id, None)
+            # Освободилось место для полосы другой группы
+            self._wakeup.set()
+        if published:
+            logging.info(f"Полоса публикации группы {chat_id} завершена: опубликовано задач {published}.")
+
+    async def _ready_chats(self) -> List[int]:
+        async with self.session_maker() as session:
+            result = await session.execute(get_ready_chats_query(datetime.utcnow()))
+            return list(result.scalars())
+
+    async def _claim(self, chat_id: int) -> Optional[int]:
+        now = datetime.utcnow()
+        async with self.session_maker() as session:
+            async with session.begin():
+                job_id = await session.scalar(get_claim_job_query(chat_id, now))
+                if job_id is not None:
+                    await session.execute(
+                        update(PublishJob)
+                        .where(PublishJob.id == job_id)
+                        .values(locked_until=now + timedelta(seconds=self.lease))
+                    )
+        return job_id
+
+    async def _process(self, job_id: int) -> bool:
+        async with self.session_maker() as session:
+            job = await session.get(PublishJob, job_id)
+            task = await session.get(Task, job.task_id) if job else None
+            if task is None:
+                logging.error(f"Задание публикации {job_id}: задача не найдена.")
+                await self._release(job_id, failed=True, last_error="Задача не найдена")
+                self._resolve(job_id, False)
+                return False
+
+            if job.state != PENDING:
+                self.resumed += 1
+                logging.info(f"Задание публикации {job_id}: продолжаем с состояния '{job.state}'.")
+
+            try:
+                for state_before, send_step, state_after in PUBLISH_STEPS:
+                    if job.state != state_before:
+                        continue
+                    await send_step(self._bot, job.chat_id, task)
+                    job.state = state_after
+                    if state_after == DONE:
+                        job.locked_until = None
+                        await session.execute(
+                            update(Task)
+                            .where(Task.id == task.id)
+                            .values(published=True, publish_date=datetime.utcnow(), group_id=job.chat_id)
+                        )
+                    await session.commit()
+
+            except TelegramRetryAfter as e:
+                # Шаг не выполнен из-за лимита — откладываем задание, попытка не засчитывается
+                self.retried += 1
+                logging.warning(f"Задание публикации {job_id}: лимит Telegram, повтор через {e.retry_after} сек.")
+                await self._release(job_id, delay=e.retry_after)
+                return False
+            except Exception as e:
+                await self._fail_attempt(job, e)
+                return False
+
+        self.published += 1
+        logging.info(f"Задача с ID {task.id} опубликована в группе {job.chat_id}.")
+        self._resolve(job_id, True)
+        return True
+
+    async def _fail_attempt(self, job: PublishJob, error: Exception) -> None:
+        attempts = job.attempts + 1
+        failed = isinstance(error, PERMANENT_ERRORS) or attempts >= self.max_attempts
+        delay = self.retry_delay * 2 ** (attempts - 1)
+
+        if failed:
+            self.failed += 1
+            logging.error(f"Задание публикации {job.id} (задача {job.task_id}) не выполнено "
+                          f"на шаге после '{job.state}': {error}")
+        else:
+            self.retried += 1
+            logging.warning(f"Задание публикации {job.id}: ошибка на шаге после '{job.state}', "
+                            f"повтор через {delay:.0f} сек.: {error}")
+
+        await self._release(job.id, delay=delay, attempts=attempts, failed=failed, last_error=str(error))
+        if failed:
+            self._resolve(job.id, False)
+
+    async def _release(self, job_id: int, delay: float = 0, **values) -> None:
+        # Отдельная сессия: сессия публикации после ошибки может быть в неконсистентном состоянии
+        try:
+            async with self.session_maker() as session:
+                await session.execute(
+                    update(PublishJob)
+                    .where(PublishJob.id == job_id)
+                    .values(locked_until=None, next_attempt_at=datetime.utcnow() + timedelta(seconds=delay), **values)
+                )
+                await session.commit()
+        except Exception as e:
+            # Захват задания истечёт сам, и оно будет повторено
+            logging.error(f"Ошибка при обновлении задания публикации {job_id}: {e}")
+
+    def _resolve(self, job_id: int, published: bool) -> None:
+        for future in self._waiters.pop(job_id, []):
+            if not future.done():
+                future.set_result(published)
+
+
+# Общая очередь публикации
+publish_queue = PublishQueue(
+    async_sessionmaker,
+    workers=PUBLISH_WORKERS,
+    max_attempts=PUBLISH_MAX_ATTEMPTS,
+    retry_delay=PUBLISH_RETRY_DELAY,
+    poll_interval=PUBLISH_POLL_INTERVAL
+)
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional, Union
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE, TELEGRAM_GROUP_BURST, \
+    TELEGRAM_PRIVATE_RATE, TELEGRAM_PRIVATE_BURST
+
+
+class TokenBucket:
+    """
+    Асинхронное «ведро с токенами»: не более rate операций в секунду в среднем
+    и не более capacity операций подряд. Ожидающие обслуживаются в порядке очереди.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: Скорость пополнения (токенов в секунду).
+        :param capacity: Ёмкость ведра (максимальная пачка операций подряд).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """
+        Забирает один токен, при необходимости дожидаясь его появления.
+
+        :return: Время ожидания в секундах.
+        """
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов (например, после ответа Telegram «Too Many Requests»).
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        """
+        Ведро полное и никто его не ждёт — его можно удалить без потери информации.
+        """
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+
+class OutboundRateLimiter:
+    """
+    Ограничитель исходящих сообщений Telegram: общее ведро на весь бот и отдельные вёдра
+    для каждого чата (для групп и каналов — свои, более строгие лимиты).
+    """
+
+    def __init__(self, global_rate: float = 30, group_rate_per_minute: float = 20, group_burst: int = 5,
+                 private_rate: float = 1, private_burst: int = 3, max_chats: int = 10000):
+        """
+        :param global_rate: Сообщений в секунду на весь бот.
+        :param group_rate_per_minute: Сообщений в минуту в одну группу или канал.
+        :param group_burst: Максимальная пачка сообщений в группу подряд.
+        :param private_rate: Сообщений в секунду в один личный чат.
+        :param private_burst: Максимальная пачка сообщений в личный чат подряд.
+        :param max_chats: Сколько вёдер чатов держать в памяти.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate_per_minute / 60
+        self.group_burst = group_burst
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.max_chats = max_chats
+        self._chat_buckets = OrderedDict()
+
+        self.sent = 0
+        self.total_wait = 0.0
+        self.retry_after_count = 0
+
+    @staticmethod
+    def is_group_chat(chat_id: Union[int, str]) -> bool:
+        """
+        Группы, супергруппы и каналы имеют отрицательный ID или задаются через @username.
+        """
+        if isinstance(chat_id, str):
+            return chat_id.startswith('@') or chat_id.startswith('-')
+        return chat_id < 0
+
+    def get_chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        """
+        Возвращает ведро токенов для чата, создавая его при необходимости.
+        """
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if self.is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._chat_buckets[chat_id] = bucket
+            self._evict_idle_buckets()
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: Optional[Union[int, str]] = None) -> float:
+        """
+        Дожидается разрешения на отправку сообщения в чат.
+        Сначала ожидается лимит чата, затем общий лимит бота, чтобы общий токен
+        не простаивал, пока сообщение ждёт своей очереди в медленном чате.
+
+        :param chat_id: ID чата получателя (None — только общий лимит).
+        :return: Суммарное время ожидания в секундах.
+        """
+        waited = 0.0
+        if chat_id is not None:
+            waited += await self.get_chat_bucket(chat_id).acquire()
+        waited += await self.global_bucket.acquire()
+
+        self.sent += 1
+        self.total_wait += waited
+        if waited > 1:
+            logging.info(f"Ограничение частоты: сообщение в чат {chat_id} ждало {waited:.1f} сек.")
+        return waited
+
+    def penalize(self, chat_id: Optional[Union[int, str]], retry_after: float) -> None:
+        """
+        Учитывает ответ Telegram «Too Many Requests»: приостанавливает чат (или весь бот).
+        """
+        self.retry_after_count += 1
+        if chat_id is None:
+            self.global_bucket.pause(retry_after)
+        else:
+            self.get_chat_bucket(chat_id).pause(retry_after)
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику ограничителя.
+        """
+        return {
+            'sent': self.sent,
+            'avg_wait_ms': round(self.total_wait / self.sent * 1000, 1) if self.sent else 0.0,
+            'retry_after': self.retry_after_count,
+            'chats': len(self._chat_buckets),
+        }
+
+    def _evict_idle_buckets(self) -> None:
+        while len(self._chat_buckets) > self.max_chats:
+            chat_id, bucket = next(iter(self._chat_buckets.items()))
+            if not bucket.idle:
+                break
+            self._chat_buckets.popitem(last=False)
+
+
+# Общий ограничитель исходящих сообщений
+outbound_limiter = OutboundRateLimiter(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    group_rate_per_minute=TELEGRAM_GROUP_RATE_PER_MINUTE,
+    group_burst=TELEGRAM_GROUP_BURST,
+    private_rate=TELEGRAM_PRIVATE_RATE,
+    private_burst=TELEGRAM_PRIVATE_BURST
+)
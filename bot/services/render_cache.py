@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from config import RENDER_CACHE_MAX_ITEMS, RENDER_CACHE_MAX_BYTES, RENDER_CACHE_DIR
+
+
+class RenderCache:
+    """
+    Кэш отрендеренных изображений (PNG-байты) с адресацией по содержимому.
+
+    Первый уровень — ограниченный LRU в памяти (по количеству записей и по суммарному размеру),
+    второй (опциональный) — каталог на диске, переживающий перезапуск бота.
+    """
+
+    def __init__(self, max_items: int = 256, max_bytes: int = 64 * 1024 * 1024, cache_dir: Optional[str] = None):
+        """
+        :param max_items: Максимальное количество изображений в памяти.
+        :param max_bytes: Максимальный суммарный размер изображений в памяти (в байтах).
+        :param cache_dir: Каталог для дискового уровня кэша (None — без дискового уровня).
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Возвращает PNG-байты по ключу или None, если изображения нет ни в памяти, ни на диске.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_from_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+            self._put_in_memory(key, data)
+            return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Сохраняет PNG-байты в памяти и (если настроено) на диске.
+        """
+        self._put_in_memory(key, data)
+        self._write_to_disk(key, data)
+
+    def clear(self) -> None:
+        """
+        Очищает уровень кэша в памяти.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику кэша.
+        """
+        with self._lock:
+            return {
+                'items': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+    def _put_in_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+
+            self._entries[key] = data
+            self._size += len(data)
+
+            # Вытесняем самые старые записи, пока не уложимся в лимиты
+            while len(self._entries) > self.max_items or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _read_from_disk(self, key: str) -> Optional[bytes]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Не удалось прочитать изображение из дискового кэша: {e}")
+            return None
+
+    def _write_to_disk(self, key: str, data: bytes) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            # Атомарная замена, чтобы параллельные читатели не увидели недописанный файл
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Не удалось записать изображение в дисковый кэш: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# Общий кэш рендеринга для всего бота
+render_cache = RenderCache(
+    max_items=RENDER_CACHE_MAX_ITEMS,
+    max_bytes=RENDER_CACHE_MAX_BYTES,
+    cache_dir=RENDER_CACHE_DIR
+)
@@ -0,0 +1,241 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+
+from bot.services.image_service import get_render_cache_key, render_png_bytes
+from bot.services.render_cache import render_cache
+from config import RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_TIMEOUT
+
+
+class RenderTimeoutError(Exception):
+    """
+    Рендеринг изображения не уложился в отведённое время.
+    """
+
+
+class RenderService:
+    """
+    Асинхронный сервис рендеринга изображений задач в пуле процессов.
+
+    Тяжёлая работа Pygments и PIL выполняется вне event loop, поэтому диспетчер
+    продолжает обрабатывать обновления других администраторов. Количество задач в пуле
+    ограничено: при заполнении очереди вызывающий код ждёт освобождения места.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32, timeout: float = 30.0):
+        """
+        :param max_workers: Количество процессов рендеринга.
+        :param max_queue: Максимальное количество задач, одновременно переданных в пул.
+        :param timeout: Таймаут рендеринга одного изображения в секундах.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}  # Ключ кэша -> выполняющийся рендер
+        self._jobs: Dict[ProcessPoolExecutor, Set[Future]] = {}  # Незавершённые задачи каждого пула
+        self._retiring: Dict[ProcessPoolExecutor, Set[Future]] = {}  # Выведенные из работы пулы -> зависшие задачи
+
+        self.queue_depth = 0  # Задачи, переданные в пул и ещё не завершённые
+        self.waiting = 0  # Задачи, ожидающие места в очереди
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_render_time = 0.0
+        self.max_render_time = 0.0
+        self.font_passes = 0  # Замеры метрик при подборе шрифта (по всем рендерам)
+        self.max_font_passes = 0
+        self.font_overflows = 0  # Код не поместился даже минимальным шрифтом
+
+    def start(self) -> None:
+        """
+        Запускает пул процессов.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logging.info(f"Пул рендеринга запущен: процессов={self.max_workers}, очередь={self.max_queue}")
+
+    def shutdown(self) -> None:
+        """
+        Останавливает пул процессов.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info("Пул рендеринга остановлен.")
+
+    async def render(self, task_text: str, logo_path: str) -> bytes:
+        """
+        Возвращает PNG-байты изображения задачи. Результат берётся из кэша рендеринга,
+        одинаковые одновременные запросы объединяются в один рендер.
+
+        :param task_text: Текст задачи (код).
+        :param logo_path: Путь к логотипу.
+        :return: Байты изображения в формате PNG.
+        """
+        key = get_render_cache_key(task_text, logo_path)
+        cached = render_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Рендер выполняется отдельной задачей, а не в вызывающем коде: отмена одного из ожидающих
+        # (например, администратор ушёл из диалога) не отменяет рендер для остальных
+        render = self._inflight.get(key)
+        if render is None:
+            render = asyncio.create_task(self._render_and_cache(key, task_text, logo_path))
+            self._inflight[key] = render
+            render.add_done_callback(lambda done: self._render_done(key, done))
+        return await asyncio.shield(render)
+
+    async def _render_and_cache(self, key: str, task_text: str, logo_path: str) -> bytes:
+        image_bytes = await self._render_in_pool(task_text, logo_path)
+        render_cache.put(key, image_bytes)
+        return image_bytes
+
+    def _render_done(self, key: str, render: asyncio.Task) -> None:
+        if self._inflight.get(key) is render:
+            del self._inflight[key]
+        if not render.cancelled():
+            # Исключение получают ожидающие; если их не осталось, оно не должно попасть в лог как необработанное
+            render.exception()
+
+    async def _render_in_pool(self, task_text: str, logo_path: str) -> bytes:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        # Пул берётся после ожидания места: пока задача ждала, пул мог быть выведен из работы или остановлен
+        loop = asyncio.get_running_loop()
+        try:
+            self.start()
+            executor = self._executor
+            pool_future = executor.submit(render_png_bytes, task_text, logo_path)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.queue_depth += 1
+        self._jobs.setdefault(executor, set()).add(pool_future)
+        # Место в очереди освобождается, только когда задача действительно завершилась в процессе
+        # (а не когда вызывающий код перестал её ждать), иначе лимит перестаёт отражать нагрузку пула
+        pool_future.add_done_callback(lambda done: self._job_done_threadsafe(loop, executor, done))
+
+        started_at = time.perf_counter()
+        try:
+            image_bytes, font_fit = await asyncio.wait_for(asyncio.wrap_future(pool_future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if not pool_future.cancel():
+                # Задача уже выполняется и не отменяется: новые рендеры идут в новый пул,
+                # а старый завершается, когда в нём останутся только зависшие задачи
+                logging.error("Зависший рендер занимает процесс пула, пул будет заменён.")
+                self._retire(executor, pool_future)
+            logging.error(f"Рендеринг изображения превысил таймаут {self.timeout} сек.")
+            raise RenderTimeoutError(f"Рендеринг изображения превысил таймаут {self.timeout} сек.")
+        except BrokenProcessPool:
+            self.failed += 1
+            logging.error("Пул рендеринга повреждён, будет создан заново.")
+            if self._executor is executor:
+                self._executor = None
+            self._terminate(executor)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        elapsed = time.perf_counter() - started_at
+        self.completed += 1
+        self.total_render_time += elapsed
+        self.max_render_time = max(self.max_render_time, elapsed)
+        self.font_passes += font_fit.passes
+        self.max_font_passes = max(self.max_font_passes, font_fit.passes)
+        self.font_overflows += not font_fit.fits
+        logging.info(
+            f"Изображение отрендерено за {elapsed * 1000:.0f} мс, шрифт {font_fit.font_size} "
+            f"(замеров: {font_fit.passes}; в пуле: {self.queue_depth}, ожидают: {self.waiting})"
+        )
+        return image_bytes
+
+    def _job_done(self, executor: ProcessPoolExecutor, pool_future: Future) -> None:
+        self.queue_depth -= 1
+        self._slots.release()
+
+        jobs = self._jobs.get(executor)
+        if jobs is not None:
+            jobs.discard(pool_future)
+            if not jobs:
+                del self._jobs[executor]
+        hung = self._retiring.get(executor)
+        if hung is not None:
+            hung.discard(pool_future)
+            if not jobs or jobs <= hung:
+                self._terminate(executor)
+
+    def _job_done_threadsafe(self, loop: asyncio.AbstractEventLoop, executor: ProcessPoolExecutor,
+                             pool_future: Future) -> None:
+        # Колбэк concurrent.futures вызывается в служебном потоке пула
+        try:
+            loop.call_soon_threadsafe(self._job_done, executor, pool_future)
+        except RuntimeError:
+            pass  # Event loop уже закрыт (остановка бота)
+
+    def _retire(self, executor: ProcessPoolExecutor, hung_future: Future) -> None:
+        """
+        Выводит пул с зависшей задачей из работы. Следующий рендер создаст новый пул,
+        а задачи, уже выполняющиеся в старом, доработают; когда в нём останутся только
+        зависшие задачи, его процессы будут завершены.
+        """
+        if self._executor is executor:
+            self._executor = None
+        hung = self._retiring.setdefault(executor, set())
+        hung.add(hung_future)
+        if self._jobs.get(executor, set()) <= hung:
+            self._terminate(executor)
+
+    def _terminate(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Останавливает пул и завершает его процессы. Невыполненные задачи этого пула
+        завершатся с BrokenProcessPool.
+        """
+        self._retiring.pop(executor, None)
+        # Публичного способа завершить процессы ProcessPoolExecutor до Python 3.14 нет
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику сервиса рендеринга.
+        """
+        average = self.total_render_time / self.completed if self.completed else 0.0
+        return {
+            'queue_depth': self.queue_depth,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'avg_render_ms': round(average * 1000, 1),
+            'max_render_ms': round(self.max_render_time * 1000, 1),
+            'avg_font_passes': round(self.font_passes / self.completed, 1) if self.completed else 0.0,
+            'max_font_passes': self.max_font_passes,
+            'font_overflows': self.font_overflows,
+            'cache': render_cache.stats(),
+        }
+
+
+# Общий сервис рендеринга для всех хэндлеров
+render_service = RenderService(
+    max_workers=RENDER_WORKERS,
+    max_queue=RENDER_QUEUE_SIZE,
+    timeout=RENDER_TIMEOUT
+)
@@ -1,58 +1,218 @@
+import time
+import asyncio
+import logging
 import boto3
 import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+from botocore.config import Config
 from PIL import Image
-from config import S3_BUCKET_NAME, S3_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+from config import S3_BUCKET_NAME, S3_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_MAX_CONNECTIONS, \
+    S3_UPLOAD_CONCURRENCY
 
-# Настройка клиента S3
+# Настройка клиента S3 (клиент потокобезопасен, пул соединений общий для всех загрузок)
 s3_client = boto3.client(
     's3',
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=S3_REGION
+    region_name=S3_REGION,
+    config=Config(max_pool_connections=S3_MAX_CONNECTIONS)
 )
 
 
-def upload_to_s3(image: Image, image_name: str) -> str:
+def get_s3_url(image_name: str) -> str:
+    """
+    Возвращает публичный URL объекта в бакете.
+    """
+    return f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{image_name}"
+
+
+def put_object_to_s3(body, image_name: str, content_type: str = 'image/png') -> Optional[str]:
+    """
+    Загружает готовые байты в S3 (синхронно) и возвращает URL.
+
+    :param body: Содержимое объекта (bytes или файловый объект).
+    :param image_name: Ключ объекта в S3.
+    :param content_type: MIME-тип объекта.
+    :return: URL загруженного объекта или None при ошибке.
+    """
+    # Загружаем изображение в S3
+    response = s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=image_name,
+        Body=body,
+        ContentType=content_type,
+        ACL='public-read'  # Обеспечивает публичный доступ к объекту
+    )
+
+    # Логирование ответа от S3
+    print(f"S3 Response: {response}")
+
+    # Проверяем, есть ли успешный ответ от S3
+    if response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200:
+        # Формируем URL загруженного изображения
+        image_url = get_s3_url(image_name)
+        print(f"Image successfully uploaded to: {image_url}")
+        return image_url
+    else:
+        print(f"Ошибка загрузки изображения в S3: {response}")
+        return None
+
+
+def upload_to_s3(image: Union[Image.Image, bytes], image_name: str) -> str:
     """
     Загружает изображение в S3 и возвращает URL.
 
-    :param image: Объект изображения PIL.
+    :param image: Уже закодированные PNG-байты (загружаются как есть) или объект изображения PIL.
     :param image_name: Имя изображения для сохранения в S3.
     :return: URL загруженного изображения или None при ошибке.
     """
     try:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return put_object_to_s3(bytes(image), image_name)
+
         # Преобразуем изображение в байты
         image_bytes = io.BytesIO()
         image.save(image_bytes, format='PNG')
         image_bytes.seek(0)
 
-        # Загружаем изображение в S3
-        response = s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=image_name,
-            Body=image_bytes,
-            ContentType='image/png',
-            ACL='public-read'  # Обеспечивает публичный доступ к объекту
-        )
-
-        # Логирование ответа от S3
-        print(f"S3 Response: {response}")
-
-        # Проверяем, есть ли успешный ответ от S3
-        if response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200:
-            # Формируем URL загруженного изображения
-            image_url = f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{image_name}"
-            print(f"Image successfully uploaded to: {image_url}")
-            return image_url
-        else:
-            print(f"Ошибка загрузки изображения в S3: {response}")
-            return None
+        return put_object_to_s3(image_bytes, image_name)
 
     except Exception as e:
         print(f"Ошибка при загрузке изображения в S3: {e}")
         return None
 
 
+def encode_png(image: Image) -> bytes:
+    """
+    Кодирует изображение PIL в PNG.
+    """
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format='PNG')
+    return image_bytes.getvalue()
+
+
+class S3Uploader:
+    """
+    Асинхронный загрузчик в S3.
+
+    Сетевые запросы выполняются в пуле потоков, поэтому не блокируют event loop.
+    Количество одновременных загрузок ограничено семафором, соединения берутся из общего пула клиента.
+    """
+
+    def __init__(self, max_connections: int = 16, concurrency: int = 8):
+        """
+        :param max_connections: Размер пула потоков (не больше пула соединений клиента).
+        :param concurrency: Максимальное количество одновременных загрузок.
+        """
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.in_flight = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix='s3-upload')
+        return self._executor
+
+    def shutdown(self) -> None:
+        """
+        Останавливает пул потоков загрузчика.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def submit(self, data: bytes, image_name: str, content_type: str = 'image/png') -> asyncio.Future:
+        """
+        Ставит загрузку в работу и сразу возвращает future с URL,
+        чтобы вызывающий код мог параллельно выполнять несколько загрузок.
+        """
+        return asyncio.ensure_future(self.upload(data, image_name, content_type))
+
+    async def upload(self, data: bytes, image_name: str, content_type: str = 'image/png') -> Optional[str]:
+        """
+        Загружает уже закодированные байты в S3 как есть, не блокируя event loop.
+
+        :param data: Содержимое объекта (bytes или memoryview).
+        :param image_name: Ключ объекта в S3.
+        :param content_type: MIME-тип объекта.
+        :return: URL загруженного объекта или None при ошибке.
+        """
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return await self._run(put_object_to_s3, data, image_name, content_type, size=len(data))
+
+    async def upload_image(self, image: Image, image_name: str) -> Optional[str]:
+        """
+        Кодирует изображение PIL в PNG и загружает его в S3; кодирование тоже выполняется вне event loop.
+
+        :param image: Объект изображения PIL.
+        :param image_name: Имя изображения для сохранения в S3.
+        :return: URL загруженного изображения или None при ошибке.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self._get_executor(), encode_png, image)
+        except Exception as e:
+            logging.error(f"Ошибка при кодировании изображения: {e}")
+            return None
+        return await self.upload(data, image_name)
+
+    async def _run(self, func, *args, size: int = 0) -> Optional[str]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            self.in_flight += 1
+            started_at = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                image_url = await loop.run_in_executor(self._get_executor(), func, *args)
+            except Exception as e:
+                logging.error(f"Ошибка при загрузке в S3: {e}")
+                image_url = None
+            finally:
+                self.in_flight -= 1
+
+        latency = time.perf_counter() - started_at
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if image_url:
+            self.uploaded += 1
+            self.bytes_uploaded += size
+        else:
+            self.failed += 1
+        return image_url
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику загрузчика.
+        """
+        finished = self.uploaded + self.failed
+        average = self.total_latency / finished if finished else 0.0
+        return {
+            'in_flight': self.in_flight,
+            'uploaded': self.uploaded,
+            'failed': self.failed,
+            'bytes_uploaded': self.bytes_uploaded,
+            'avg_latency_ms': round(average * 1000, 1),
+            'max_latency_ms': round(self.max_latency * 1000, 1),
+        }
+
+
+# Общий асинхронный загрузчик для всех хэндлеров
+s3_uploader = S3Uploader(max_connections=S3_MAX_CONNECTIONS, concurrency=S3_UPLOAD_CONCURRENCY)
+
+
 # # Тестовая функция для проверки загрузки
 # def test_upload_to_s3():
 #     """
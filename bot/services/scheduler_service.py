@@ -1,40 +1,337 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
-from database.database import get_async_session
-from database.models import Task
-from aiogram import Bot
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
 
+from sqlalchemy import insert, literal_column, select, update
 
-# Инициализация планировщика
-scheduler = AsyncIOScheduler()
+from bot.services.group_routing import group_routing
+from bot.services.publish_queue import publish_queue, get_enqueue_query
+from config import SCHEDULER_LOOKAHEAD, SCHEDULER_REFRESH_INTERVAL, SCHEDULER_BATCH_SIZE, SCHEDULER_MISFIRE_GRACE_TIME
+from database.bulk import iter_chunks
+from database.database import async_sessionmaker
+from database.models import PublishJob, ScheduledPost, Task
 
 
-def schedule_task_post(task_id: int, post_time: datetime, bot: Bot):
+# Состояния отложенной публикации
+SCHEDULED = 'scheduled'
+ENQUEUED = 'enqueued'  # Передана в очередь публикации
+SKIPPED = 'skipped'  # Опоздала больше, чем на misfire_grace, или задача уже опубликована в эту группу
+FAILED = 'failed'  # Не найдена группа для публикации
+CANCELLED = 'cancelled'
+
+# Условие ожидающих публикаций; состояние записано в SQL литералом (как NOT_DONE в publish_queue),
+# чтобы условие совпадало с частичным индексом ix_scheduled_posts_due и в обобщённом плане
+IS_SCHEDULED = ScheduledPost.state == literal_column(f"'{SCHEDULED}'")
+
+
+def to_utc(moment: datetime) -> datetime:
+    """
+    Приводит время к наивному UTC, в котором время хранится в базе.
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def get_due_posts_query(until: datetime, limit: int):
     """
-    Функция для планирования задачи на отложенный постинг.
-    :param task_id: ID задачи для публикации
-    :param post_time: Время публикации (формат datetime)
-    :param bot: Экземпляр бота для отправки сообщений
+    Запрос ближайших запланированных публикаций (использует индекс ix_scheduled_posts_due).
     """
-    scheduler.add_job(post_task_to_channel, 'date', run_date=post_time, args=[task_id, bot])
+    return (
+        select(ScheduledPost.id, ScheduledPost.run_at)
+        .where(IS_SCHEDULED, ScheduledPost.run_at <= until)
+        .order_by(ScheduledPost.run_at, ScheduledPost.id)
+        .limit(limit)
+    )
 
 
-async def post_task_to_channel(task_id: int, bot: Bot):
+class PostScheduler:
     """
-    Функция для публикации задачи в канал Telegram в отложенное время.
-    :param task_id: ID задачи, которая будет опубликована
-    :param bot: Экземпляр бота для отправки сообщений
+    Планировщик отложенных публикаций задач, хранящий расписание в базе данных (таблица scheduled_posts).
+
+    Вместо отдельного таймера на каждую публикацию используется одна куча (run_at, id) с публикациями
+    ближайших lookahead секунд и один фоновый цикл, который спит до ближайшего срока. Куча периодически
+    перечитывается из базы, поэтому публикации, запланированные другой копией бота, тоже выполняются,
+    а после перезапуска пропущенные публикации догоняются (с учётом misfire_grace).
+
+    Наступившие публикации забираются из базы условным UPDATE (одну публикацию не возьмут две копии бота)
+    и в той же транзакции ставятся в обычную очередь публикации (publish_jobs).
     """
-    async for session in get_async_session():
-        task = await session.get(Task, task_id)
-        if task:
-            # Публикуем задачу в Telegram-канале
-            await bot.send_message(
-                chat_id="@your_channel",  # Замените на ваш канал
-                text=f"Новая задача по теме: {task.topic}\n\n{task.question}\n\n"
-                     f"Ответы: {task.wrong_answers}\n\nУзнать больше: {task.resource_link}",
-                disable_web_page_preview=False
+
+    def __init__(self, session_maker, publisher, lookahead: float = 600, refresh_interval: float = 60,
+                 batch_size: int = 500, misfire_grace: int = 3600):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param publisher: Очередь публикации (PublishQueue).
+        :param lookahead: На сколько секунд вперёд держать публикации в куче.
+        :param refresh_interval: Как часто перечитывать ближайшие публикации из базы (сек.).
+        :param batch_size: Публикаций в одной выборке и одной транзакции запуска.
+        :param misfire_grace: Опоздание (сек.), после которого публикация пропускается (0 — публиковать всегда).
+        """
+        self.session_maker = session_maker
+        self.publisher = publisher
+        self.lookahead = lookahead
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.misfire_grace = misfire_grace
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._in_heap: Set[int] = set()
+        self._loaded_until = datetime.min  # До какого времени куча совпадает с базой
+        self._timer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.scheduled = 0
+        self.enqueued = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def schedule(self, task_id: int, run_at: datetime, chat_id: Optional[int] = None) -> int:
+        """
+        Планирует публикацию задачи.
+
+        :param task_id: ID задачи.
+        :param run_at: Время публикации (наивное время считается UTC).
+        :param chat_id: Telegram ID группы; если не указан, группа выбирается по теме и языку задачи.
+        :return: ID запланированной публикации.
+        """
+        ids = await self.schedule_many([{'task_id': task_id, 'run_at': run_at, 'chat_id': chat_id}])
+        return ids[0]
+
+    async def schedule_many(self, posts: Iterable[dict]) -> List[int]:
+        """
+        Планирует пакет публикаций многострочными INSERT.
+
+        :param posts: Словари с ключами task_id, run_at и необязательными chat_id, misfire_grace.
+        :return: ID запланированных публикаций в порядке posts.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                'task_id': post['task_id'],
+                'chat_id': post.get('chat_id'),
+                'run_at': to_utc(post['run_at']),
+                'misfire_grace': post.get('misfire_grace', self.misfire_grace) or None,
+                'state': SCHEDULED,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for post in posts
+        ]
+        if not rows:
+            return []
+
+        post_ids = []
+        async with self.session_maker() as session:
+            for chunk in iter_chunks(rows, self.batch_size):
+                result = await session.execute(
+                    insert(ScheduledPost).returning(ScheduledPost.id, sort_by_parameter_order=True),
+                    list(chunk)
+                )
+                post_ids.extend(result.scalars())
+            await session.commit()
+
+        horizon = now + timedelta(seconds=self.lookahead)
+        for post_id, row in zip(post_ids, rows):
+            if row['run_at'] <= horizon:
+                self._push(row['run_at'], post_id)
+        self.scheduled += len(post_ids)
+        logging.info(f"Запланировано публикаций: {len(post_ids)}")
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return post_ids
+
+    async def cancel(self, post_id: int) -> bool:
+        """
+        Отменяет запланированную публикацию.
+
+        :return: False, если публикация уже выполнена или не найдена.
+        """
+        async with self.session_maker() as session:
+            result = await session.execute(
+                update(ScheduledPost)
+                .where(ScheduledPost.id == post_id, IS_SCHEDULED)
+                .values(state=CANCELLED, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        # Запись в куче остаётся и будет пропущена при запуске: состояние уже не scheduled
+        return result.rowcount > 0
+
+    def start(self) -> None:
+        """
+        Запускает таймер. Первая выборка забирает и пропущенные за время простоя публикации.
+        """
+        self._wakeup = asyncio.Event()
+        self._timer = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        """
+        Останавливает таймер. Невыполненные публикации остаются в базе.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику планировщика.
+        """
+        return {
+            'in_timer': len(self._heap),
+            'scheduled': self.scheduled,
+            'enqueued': self.enqueued,
+            'skipped': self.skipped,
+            'failed': self.failed,
+        }
+
+    def _push(self, run_at: datetime, post_id: int) -> None:
+        if post_id not in self._in_heap:
+            self._in_heap.add(post_id)
+            heapq.heappush(self._heap, (run_at, post_id))
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, post_id = heapq.heappop(self._heap)
+            self._in_heap.discard(post_id)
+            due.append(post_id)
+        return due
+
+    async def _run(self) -> None:
+        next_refresh = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_refresh or datetime.utcnow() >= self._loaded_until:
+                    next_refresh = time.monotonic() + self.refresh_interval
+                    await self._refresh()
+
+                for chunk in iter_chunks(self._pop_due(datetime.utcnow()), self.batch_size):
+                    await self._fire(list(chunk))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка планировщика публикаций: {e}")
+                await asyncio.sleep(min(self.refresh_interval, 5))
+                continue
+
+            # Спим до ближайшей публикации, конца загруженного окна или следующего перечитывания
+            now = datetime.utcnow()
+            deadlines = [next_refresh - time.monotonic(), (self._loaded_until - now).total_seconds()]
+            if self._heap:
+                deadlines.append((self._heap[0][0] - now).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(min(deadlines), 0))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _refresh(self) -> None:
+        horizon = datetime.utcnow() + timedelta(seconds=self.lookahead)
+        async with self.session_maker() as session:
+            rows = (await session.execute(get_due_posts_query(horizon, self.batch_size))).all()
+
+        for post_id, run_at in rows:
+            self._push(run_at, post_id)
+        # Если выборка упёрлась в лимит, следующие публикации не раньше последней загруженной
+        self._loaded_until = rows[-1].run_at if len(rows) >= self.batch_size else horizon
+
+    async def _fire(self, post_ids: List[int]) -> None:
+        now = datetime.utcnow()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                update(ScheduledPost)
+                .where(ScheduledPost.id.in_(post_ids), IS_SCHEDULED, ScheduledPost.run_at <= now)
+                .values(state=ENQUEUED, updated_at=now)
+                .returning(ScheduledPost.id, ScheduledPost.task_id, ScheduledPost.chat_id,
+                           ScheduledPost.run_at, ScheduledPost.misfire_grace)
             )
+            posts = sorted(result.all(), key=lambda post: (post.run_at, post.id))
+            if not posts:
+                await session.commit()
+                return
+
+            # Политика пропуска: публикация, опоздавшая больше misfire_grace (например, бот долго
+            # не работал), уже неактуальна; без misfire_grace опоздавшие публикации догоняются
+            skipped = {
+                post.id for post in posts
+                if post.misfire_grace is not None and now - post.run_at > timedelta(seconds=post.misfire_grace)
+            }
+            live = [post for post in posts if post.id not in skipped]
+
+            # Группа публикаций без явно указанной группы — по теме и языку задачи
+            task_ids = {post.task_id for post in live if post.chat_id is None}
+            tasks = {}
+            if task_ids:
+                task_rows = await session.execute(
+                    select(Task.id, Task.topic, Task.language).where(Task.id.in_(task_ids))
+                )
+                tasks = {task_id: (topic, language) for task_id, topic, language in task_rows}
+
+            jobs = {}  # (task_id, chat_id) -> ID публикации
+            duplicates = []  # Та же задача в ту же группу уже есть в этом пакете
+            failed = []
+            for post in live:
+                chat_id = post.chat_id
+                if chat_id is None and post.task_id in tasks:
+                    group = await group_routing.get(*tasks[post.task_id])
+                    chat_id = group.group_id if group is not None else None
+                if chat_id is None:
+                    failed.append(post.id)
+                    continue
+                if (post.task_id, chat_id) in jobs:
+                    duplicates.append(post.id)
+                else:
+                    jobs[(post.task_id, chat_id)] = post.id
+
+            queued = set()
+            if jobs:
+                result = await session.execute(
+                    get_enqueue_query([{'task_id': task_id, 'chat_id': chat_id} for task_id, chat_id in jobs], now)
+                    .returning(PublishJob.task_id, PublishJob.chat_id)
+                )
+                queued = {(task_id, chat_id) for task_id, chat_id in result}
+
+            # Если задание этой пары уже выполнено или активно, ON CONFLICT его не меняет и ничего не
+            # возвращает: публикация не будет отправлена ещё раз, отмечаем это в расписании
+            already_queued = [post_id for pair, post_id in jobs.items() if pair not in queued] + duplicates
+            if already_queued:
+                await session.execute(
+                    update(ScheduledPost).where(ScheduledPost.id.in_(already_queued))
+                    .values(state=SKIPPED, updated_at=now,
+                            last_error="Задача уже опубликована или стоит в очереди публикации в эту группу")
+                )
+            if skipped:
+                await session.execute(
+                    update(ScheduledPost).where(ScheduledPost.id.in_(skipped))
+                    .values(state=SKIPPED, last_error="Время публикации пропущено", updated_at=now)
+                )
+            if failed:
+                await session.execute(
+                    update(ScheduledPost).where(ScheduledPost.id.in_(failed))
+                    .values(state=FAILED, last_error="Группа для публикации не найдена", updated_at=now)
+                )
+            await session.commit()
+
+        if queued:
+            self.publisher.notify()
+        self.enqueued += len(queued)
+        self.skipped += len(skipped) + len(already_queued)
+        self.failed += len(failed)
+        logging.info(f"Отложенные публикации: в очередь {len(queued)}, пропущено {len(skipped)}, "
+                     f"уже в очереди или опубликовано {len(already_queued)}, без группы {len(failed)}.")
+
 
-# Запускаем планировщик
-scheduler.start()
+# Общий планировщик отложенных публикаций
+post_scheduler = PostScheduler(
+    async_sessionmaker,
+    publish_queue,
+    lookahead=SCHEDULER_LOOKAHEAD,
+    refresh_interval=SCHEDULER_REFRESH_INTERVAL,
+    batch_size=SCHEDULER_BATCH_SIZE,
+    misfire_grace=SCHEDULER_MISFIRE_GRACE_TIME
+)
@@ -0,0 +1,55 @@
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+from sqlalchemy import update
+
+from database.database import async_sessionmaker
+from database.models import Task
+
+
+async def send_task_photo(bot: Bot, chat_id: int, task: Task, caption: str = None, reply_markup=None) -> Message:
+    """
+    Отправляет изображение задачи в чат.
+
+    После первой успешной отправки file_id изображения сохраняется в задаче, и все следующие
+    отправки (повторная публикация, другие группы) используют его — Telegram не скачивает
+    изображение из S3 заново.
+
+    :param bot: Экземпляр бота.
+    :param chat_id: ID чата, в который отправляется изображение.
+    :param task: Задача, изображение которой отправляется.
+    :param caption: Подпись к изображению.
+    :param reply_markup: Клавиатура под изображением.
+    :return: Отправленное сообщение.
+    """
+    if task.image_file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=task.image_file_id,
+                                        caption=caption, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            # file_id мог стать недействительным — отправляем по URL и запоминаем новый file_id
+            logging.warning(f"Не удалось отправить изображение задачи {task.id} по file_id: {e}")
+
+    message = await bot.send_photo(chat_id=chat_id, photo=task.image_url,
+                                   caption=caption, reply_markup=reply_markup)
+
+    if message.photo:
+        await save_task_file_id(task, message.photo[-1].file_id)
+    return message
+
+
+async def save_task_file_id(task: Task, file_id: str) -> None:
+    """
+    Сохраняет file_id изображения задачи в базе данных.
+    Запись выполняется в отдельной сессии, чтобы не затрагивать транзакцию вызывающего кода.
+    """
+    task.image_file_id = file_id
+    try:
+        async with async_sessionmaker() as session:
+            await session.execute(update(Task).where(Task.id == task.id).values(image_file_id=file_id))
+            await session.commit()
+        logging.info(f"file_id изображения задачи {task.id} сохранён.")
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении file_id изображения задачи {task.id}: {e}")
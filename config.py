@@ -24,3 +24,95 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 
 # Получаем ALLOWED_USERS из .env и конвертируем из строки в список
 ALLOWED_USERS = json.loads(os.getenv("ALLOWED_USERS", "[]"))
+
+
+# Кэш отрендеренных изображений задач
+RENDER_CACHE_MAX_ITEMS = int(os.getenv("RENDER_CACHE_MAX_ITEMS", "256"))   # Количество изображений в памяти
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))   # Лимит памяти кэша в байтах
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR") or None   # Каталог дискового кэша (пусто — только память)
+
+
+# Пул процессов для рендеринга изображений
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 2)))   # Количество процессов рендеринга
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "32"))   # Максимум задач рендеринга в пуле одновременно
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "30"))   # Таймаут рендеринга одного изображения (сек.)
+
+
+# Конвейер массового импорта задач из JSON
+IMPORT_RENDER_CONCURRENCY = int(os.getenv("IMPORT_RENDER_CONCURRENCY", str(RENDER_WORKERS)))   # Параллельных рендеров
+IMPORT_UPLOAD_CONCURRENCY = int(os.getenv("IMPORT_UPLOAD_CONCURRENCY", "8"))   # Параллельных загрузок в S3
+IMPORT_DB_BATCH_SIZE = int(os.getenv("IMPORT_DB_BATCH_SIZE", "100"))   # Задач в одной транзакции записи
+IMPORT_INSERT_CHUNK_SIZE = int(os.getenv("IMPORT_INSERT_CHUNK_SIZE", "500"))   # Строк в одном многострочном INSERT задач и переводов
+IMPORT_PROGRESS_INTERVAL = float(os.getenv("IMPORT_PROGRESS_INTERVAL", "3"))   # Интервал обновления прогресса (сек.)
+JSON_STREAMING_THRESHOLD = int(os.getenv("JSON_STREAMING_THRESHOLD", str(1024 * 1024)))   # С какого размера файла (байт) разбирать JSON потоково
+
+
+# Загрузка изображений в S3
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "16"))   # Размер пула соединений клиента S3
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "8"))   # Максимум одновременных загрузок
+IMAGE_INDEX_CACHE_SIZE = int(os.getenv("IMAGE_INDEX_CACHE_SIZE", "10000"))   # Сколько хэшей уже загруженных изображений держать в памяти
+
+
+# Ограничение частоты исходящих запросов к Telegram
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))   # Сообщений в секунду на весь бот
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))   # Сообщений в минуту в одну группу
+TELEGRAM_GROUP_BURST = int(os.getenv("TELEGRAM_GROUP_BURST", "5"))   # Допустимая пачка сообщений в группу подряд
+TELEGRAM_PRIVATE_RATE = float(os.getenv("TELEGRAM_PRIVATE_RATE", "1"))   # Сообщений в секунду в личный чат
+TELEGRAM_PRIVATE_BURST = int(os.getenv("TELEGRAM_PRIVATE_BURST", "3"))   # Допустимая пачка сообщений в личный чат
+TELEGRAM_RETRY_AFTER_ATTEMPTS = int(os.getenv("TELEGRAM_RETRY_AFTER_ATTEMPTS", "3"))   # Повторов после ответа RetryAfter
+
+
+# Очередь публикации задач в группы
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", "16"))   # Сколько групп публикуются одновременно (по полосе на группу)
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))   # Попыток на одну публикацию до статуса failed
+PUBLISH_RETRY_DELAY = float(os.getenv("PUBLISH_RETRY_DELAY", "30"))   # Базовая задержка повтора после ошибки (сек.)
+PUBLISH_POLL_INTERVAL = float(os.getenv("PUBLISH_POLL_INTERVAL", "5"))   # Как часто свободный воркер проверяет очередь (сек.)
+PUBLISH_WAIT_TIMEOUT = float(os.getenv("PUBLISH_WAIT_TIMEOUT", "60"))   # Сколько ждать публикации одной задачи перед ответом (сек.)
+PUBLISH_FETCH_BATCH_SIZE = int(os.getenv("PUBLISH_FETCH_BATCH_SIZE", "500"))   # Задач в одной странице выборки для массовой публикации
+GROUP_ROUTING_TTL = float(os.getenv("GROUP_ROUTING_TTL", "300"))   # Через сколько секунд перечитывать таблицу групп (0 — только по /reload_groups)
+
+
+# Подключение к базе данных (один общий движок и пул соединений)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))   # Постоянных соединений в пуле
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))   # Дополнительных соединений сверх пула при пиковой нагрузке
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))   # Сколько ждать свободного соединения (сек.)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # Пересоздавать соединения старше N секунд
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")   # Проверять соединение перед выдачей из пула
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))   # Кэш скомпилированных SQL-выражений SQLAlchemy (общий на процесс)
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))   # Подготовленных запросов asyncpg на каждом соединении (на стороне PostgreSQL)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")   # Логировать каждый SQL-запрос (только для отладки)
+
+
+# Отложенная запись профилей пользователей
+USER_PROFILE_CACHE_SIZE = int(os.getenv("USER_PROFILE_CACHE_SIZE", "100000"))   # Сколько уже записанных профилей помнить, чтобы не писать их повторно
+USER_FLUSH_INTERVAL_MS = int(os.getenv("USER_FLUSH_INTERVAL_MS", "500"))   # Как часто записывать буфер профилей (мс)
+USER_FLUSH_BATCH_SIZE = int(os.getenv("USER_FLUSH_BATCH_SIZE", "500"))   # Профилей, при которых буфер записывается сразу
+USER_FLUSH_MAX_PENDING = int(os.getenv("USER_FLUSH_MAX_PENDING", "100000"))   # Максимум профилей в буфере (при переполнении старые отбрасываются)
+USER_FLUSH_MAX_RETRIES = int(os.getenv("USER_FLUSH_MAX_RETRIES", "10"))   # Повторов записи профиля после ошибки базы
+
+
+# Промежуточные файлы мастера создания задачи (изображения предпросмотра)
+ARTIFACT_TTL = float(os.getenv("ARTIFACT_TTL", "3600"))   # Сколько хранить изображение незавершённой задачи (сек.)
+ARTIFACT_MAX_BYTES_PER_USER = int(os.getenv("ARTIFACT_MAX_BYTES_PER_USER", str(8 * 1024 * 1024)))   # Лимит на одного пользователя
+ARTIFACT_MAX_TOTAL_BYTES = int(os.getenv("ARTIFACT_MAX_TOTAL_BYTES", str(128 * 1024 * 1024)))   # Общий лимит памяти
+
+
+# Хранилище состояний FSM (черновики мастера создания задачи)
+# memory:// — в памяти процесса; redis://host:6379/0 — Redis; fakeredis:// — встроенный заменитель Redis;
+# database — таблица fsm_states в основной базе; sqlite+aiosqlite:///fsm.db — отдельная база SQLite
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL", "memory://")
+
+
+# Приём ответов на опросы (статистика задач)
+POLL_ANSWER_FLUSH_INTERVAL = float(os.getenv("POLL_ANSWER_FLUSH_INTERVAL", "2"))   # Как часто записывать накопленные ответы (сек.)
+POLL_ANSWER_MAX_BATCH = int(os.getenv("POLL_ANSWER_MAX_BATCH", "2000"))   # Ответов, при которых буфер записывается сразу
+POLL_ANSWER_MAX_PENDING = int(os.getenv("POLL_ANSWER_MAX_PENDING", "200000"))   # Максимум ответов в буфере (при переполнении старые отбрасываются)
+POLL_ANSWER_MAX_RETRIES = int(os.getenv("POLL_ANSWER_MAX_RETRIES", "10"))   # Повторов записи ответа после ошибки базы
+POLL_MAPPING_CACHE_SIZE = int(os.getenv("POLL_MAPPING_CACHE_SIZE", "10000"))   # Сколько опросов (poll_id -> задача) держать в памяти
+
+
+# Отложенная публикация задач
+SCHEDULER_LOOKAHEAD = float(os.getenv("SCHEDULER_LOOKAHEAD", "600"))   # На сколько секунд вперёд держать публикации в таймере
+SCHEDULER_REFRESH_INTERVAL = float(os.getenv("SCHEDULER_REFRESH_INTERVAL", "60"))   # Как часто перечитывать ближайшие публикации из базы (сек.)
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))   # Публикаций в одной выборке и одной транзакции запуска
+SCHEDULER_MISFIRE_GRACE_TIME = int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", "3600"))   # Опоздавшие дольше (сек.) публикации пропускаются (0 — публиковать всегда)
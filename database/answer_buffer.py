@@ -0,0 +1,203 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database.answer_stats import PollInfo, ResolvedAnswer, update_answer_aggregates
+from database.bulk import iter_chunks
+from database.models import PollMapping, Task, TaskStatistics, User
+from database.user_buffer import get_user_row
+from database.write_buffer import WriteBuffer
+
+
+AnswerKey = Tuple[int, str]  # (telegram_id, poll_id)
+
+
+class PollAnswerBuffer(WriteBuffer):
+    """
+    Буфер ответов на опросы задач.
+
+    Хэндлер poll_answer только кладёт ответ в память. Фоновая задача раз в flush_interval секунд
+    (или при накоплении max_batch ответов) находит задачи опросов по таблице poll_mappings,
+    складывает ответы одного пользователя на одну задачу и записывает их в task_statistics
+    многострочными INSERT ... ON CONFLICT DO UPDATE — одна транзакция на пакет, а не на голос.
+    В той же транзакции обновляются агрегаты по задачам и темам (см. update_answer_aggregates).
+
+    Если пакет отклонён базой (например, задача удалена, а её опрос ещё в кэше), опросы пакета
+    убираются из кэша и перечитываются из poll_mappings; обработка ошибок — см. WriteBuffer.
+    """
+
+    description = 'ответов на опросы'
+
+    def __init__(self, session_maker, flush_interval: float = 2, max_batch: int = 2000,
+                 max_pending: int = 200000, max_retries: int = 10,
+                 poll_cache_size: int = 10000, chunk_size: int = 1000):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param flush_interval: Интервал записи буфера в базу (сек.).
+        :param max_batch: Количество ответов, при котором буфер записывается, не дожидаясь интервала.
+        :param max_pending: Максимум ответов в буфере.
+        :param max_retries: Сколько раз повторять запись ответа после ошибки.
+        :param poll_cache_size: Сколько опросов (poll_id -> задача) держать в памяти.
+        :param chunk_size: Максимум строк в одном INSERT.
+        """
+        super().__init__(session_maker, flush_interval, max_batch, max_pending, max_retries)
+        self.poll_cache_size = poll_cache_size
+        self.chunk_size = chunk_size
+
+        # В буфере: (telegram_id, poll_id) -> (выбранные варианты, время ответа, username, язык)
+        self._polls = OrderedDict()  # poll_id -> PollInfo
+
+        self.received = 0
+        self.unknown = 0
+
+    async def register_poll(self, poll_id: str, task: Task, chat_id: int, correct_option_id: int) -> None:
+        """
+        Запоминает, к какой задаче относится опубликованный опрос.
+
+        Ошибка записи только логируется: опрос уже отправлен, и повтор шага публикации
+        отправил бы его ещё раз. Ответы на такой опрос учитываются, пока он есть в кэше.
+        """
+        self._cache_poll(poll_id, PollInfo(task.id, correct_option_id, chat_id, task.topic, task.language or ''))
+        stmt = insert(PollMapping).values(
+            poll_id=poll_id,
+            task_id=task.id,
+            chat_id=chat_id,
+            correct_option_id=correct_option_id,
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[PollMapping.poll_id])
+        try:
+            async with self.session_maker() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении опроса {poll_id} задачи {task.id}: {e}")
+
+    def put(self, poll_id: str, telegram_id: int, option_ids: Iterable[int], answered_at: datetime,
+            username: Optional[str] = None, language: Optional[str] = None) -> None:
+        """
+        Кладёт ответ пользователя на опрос в буфер.
+
+        Голос в опросе-викторине изменить нельзя, поэтому повторный ответ того же пользователя
+        на тот же опрос (повторная доставка обновления) заменяет предыдущий, а не считается попыткой.
+        """
+        self._put((telegram_id, poll_id), (tuple(option_ids), answered_at, username, language))
+        self.received += 1
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику буфера.
+        """
+        return {**super().stats(), 'received': self.received, 'unknown': self.unknown}
+
+    def _on_integrity_error(self, batch: Dict[AnswerKey, tuple]) -> None:
+        # Закэшированный опрос мог пережить свою задачу (poll_mappings удаляется каскадно):
+        # при повторе опросы перечитываются из базы, а ответы на удалённые задачи станут неизвестными
+        for _, poll_id in batch:
+            self._polls.pop(poll_id, None)
+
+    async def _write(self, session, batch: Dict[AnswerKey, tuple]) -> int:
+        polls = await self._resolve_polls(session, {poll_id for _, poll_id in batch})
+
+        # (telegram_id, task_id) -> [попытки, был ли правильный ответ, время последнего ответа]
+        attempts: Dict[Tuple[int, int], list] = {}
+        answers = []  # (telegram_id, PollInfo, правильный ли ответ)
+        users = {}
+        for (telegram_id, poll_id), (option_ids, answered_at, username, language) in batch.items():
+            poll = polls.get(poll_id)
+            if poll is None:
+                # Опрос опубликован не через очередь публикации (или до появления poll_mappings)
+                self.unknown += 1
+                continue
+            correct = poll.correct_option_id in option_ids
+            answers.append((telegram_id, poll, correct))
+            users[telegram_id] = get_user_row(telegram_id, username, language)
+            entry = attempts.setdefault((telegram_id, poll.task_id), [0, False, answered_at])
+            entry[0] += 1
+            entry[1] = entry[1] or correct
+            entry[2] = max(entry[2], answered_at)
+
+        if not attempts:
+            return 0
+
+        # Пользователи, которые отвечают в группе, но ни разу не писали боту
+        for chunk in iter_chunks(list(users.values()), self.chunk_size):
+            await session.execute(
+                insert(User).values(list(chunk)).on_conflict_do_nothing(index_elements=[User.telegram_id])
+            )
+        result = await session.execute(
+            select(User.telegram_id, User.id).where(User.telegram_id.in_(list(users)))
+        )
+        user_ids = dict(result.all())
+
+        rows = sorted(
+            (
+                {
+                    'user_id': user_ids[telegram_id],
+                    'task_id': task_id,
+                    'attempts': count,
+                    'successful': successful,
+                    'last_attempt_date': last_attempt_date,
+                }
+                for (telegram_id, task_id), (count, successful, last_attempt_date) in attempts.items()
+            ),
+            # Одинаковый порядок блокировки строк у всех копий бота исключает взаимные блокировки
+            key=lambda row: (row['user_id'], row['task_id'])
+        )
+        new_task_users = []  # (user_id, task_id), которых ещё не было в task_statistics
+        for chunk in iter_chunks(rows, self.chunk_size):
+            stmt = insert(TaskStatistics).values(list(chunk))
+            stmt = stmt.on_conflict_do_update(
+                constraint='uq_task_statistics_user_task',
+                set_={
+                    'attempts': TaskStatistics.attempts + stmt.excluded.attempts,
+                    'successful': or_(TaskStatistics.successful, stmt.excluded.successful),
+                    'last_attempt_date': func.greatest(TaskStatistics.last_attempt_date,
+                                                       stmt.excluded.last_attempt_date),
+                }
+            ).returning(
+                # xmax = 0 только у строк, вставленных этим запросом (а не обновлённых)
+                TaskStatistics.user_id, TaskStatistics.task_id, literal_column('xmax = 0')
+            )
+            result = await session.execute(stmt)
+            new_task_users.extend((user_id, task_id) for user_id, task_id, inserted in result if inserted)
+
+        await update_answer_aggregates(
+            session,
+            [ResolvedAnswer(user_ids[telegram_id], poll, correct) for telegram_id, poll, correct in answers],
+            new_task_users,
+            self.chunk_size
+        )
+        return len(rows)
+
+    async def _resolve_polls(self, session, poll_ids: set) -> Dict[str, PollInfo]:
+        polls = {}
+        missing = []
+        for poll_id in poll_ids:
+            poll = self._polls.get(poll_id)
+            if poll is None:
+                missing.append(poll_id)
+            else:
+                self._polls.move_to_end(poll_id)
+                polls[poll_id] = poll
+
+        if missing:
+            result = await session.execute(
+                select(PollMapping.poll_id, PollMapping.task_id, PollMapping.correct_option_id,
+                       PollMapping.chat_id, Task.topic, Task.language)
+                .join(Task, Task.id == PollMapping.task_id)
+                .where(PollMapping.poll_id.in_(missing))
+            )
+            for poll_id, task_id, correct_option_id, chat_id, topic, language in result:
+                polls[poll_id] = PollInfo(task_id, correct_option_id, chat_id, topic, language or '')
+                self._cache_poll(poll_id, polls[poll_id])
+        return polls
+
+    def _cache_poll(self, poll_id: str, poll: PollInfo) -> None:
+        self._polls[poll_id] = poll
+        self._polls.move_to_end(poll_id)
+        while len(self._polls) > self.poll_cache_size:
+            self._polls.popitem(last=False)
@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Set, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.bulk import iter_chunks
+from database.models import TaskAnswerStats, TopicAnswerStats, TopicAnswerUser
+
+
+class PollInfo(NamedTuple):
+    """
+    Опубликованный опрос задачи.
+    """
+    task_id: int
+    correct_option_id: int
+    chat_id: int  # Группа, в которой опубликован опрос
+    topic: str
+    language: str
+
+
+class ResolvedAnswer(NamedTuple):
+    """
+    Ответ пользователя, для которого найден опрос.
+    """
+    user_id: int  # users.id
+    poll: PollInfo
+    correct: bool
+
+
+async def update_answer_aggregates(session: AsyncSession, answers: List[ResolvedAnswer],
+                                   new_task_users: Iterable[Tuple[int, int]], chunk_size: int = 1000) -> None:
+    """
+    Добавляет пакет ответов к агрегатам по задачам и по темам (тема, язык, группа).
+
+    Агрегаты только увеличиваются на значения пакета, поэтому не требуют пересчёта по task_statistics.
+    Транзакцию не фиксирует — агрегаты пишутся в той же транзакции, что и task_statistics.
+
+    :param session: Сессия базы данных.
+    :param answers: Ответы пакета.
+    :param new_task_users: Пары (user_id, task_id), впервые появившиеся в task_statistics в этом пакете.
+    :param chunk_size: Максимум строк в одном INSERT.
+    """
+    now = datetime.utcnow()
+
+    # task_id -> [тема, язык, ответов, правильных, новых пользователей]
+    tasks = {}
+    # (тема, язык, группа) -> [ответов, правильных, новых пользователей]
+    topics = {}
+    topic_users: Set[Tuple[str, str, int, int]] = set()
+    for answer in answers:
+        poll = answer.poll
+        task = tasks.setdefault(poll.task_id, [poll.topic, poll.language, 0, 0, 0])
+        task[2] += 1
+        task[3] += answer.correct
+        topic_key = (poll.topic, poll.language, poll.chat_id)
+        topic = topics.setdefault(topic_key, [0, 0, 0])
+        topic[0] += 1
+        topic[1] += answer.correct
+        topic_users.add(topic_key + (answer.user_id,))
+
+    for _, task_id in new_task_users:
+        tasks[task_id][4] += 1
+
+    # Уникальные пользователи темы: учитываются только впервые вставленные строки
+    topic_user_rows = [
+        {'topic': topic, 'language': language, 'chat_id': chat_id, 'user_id': user_id}
+        for topic, language, chat_id, user_id in sorted(topic_users)
+    ]
+    for chunk in iter_chunks(topic_user_rows, chunk_size):
+        result = await session.execute(
+            insert(TopicAnswerUser).values(list(chunk)).on_conflict_do_nothing().returning(
+                TopicAnswerUser.topic, TopicAnswerUser.language, TopicAnswerUser.chat_id
+            )
+        )
+        for topic, language, chat_id in result:
+            topics[(topic, language, chat_id)][2] += 1
+
+    task_rows = [
+        {
+            'task_id': task_id,
+            'topic': topic,
+            'language': language,
+            'answers': count,
+            'correct_answers': correct,
+            'unique_users': new_users,
+            'updated_at': now,
+        }
+        for task_id, (topic, language, count, correct, new_users) in sorted(tasks.items())
+    ]
+    for chunk in iter_chunks(task_rows, chunk_size):
+        stmt = insert(TaskAnswerStats).values(list(chunk))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TaskAnswerStats.task_id],
+            set_={
+                'answers': TaskAnswerStats.answers + stmt.excluded.answers,
+                'correct_answers': TaskAnswerStats.correct_answers + stmt.excluded.correct_answers,
+                'unique_users': TaskAnswerStats.unique_users + stmt.excluded.unique_users,
+                'updated_at': stmt.excluded.updated_at,
+            }
+        )
+        await session.execute(stmt)
+
+    topic_rows = [
+        {
+            'topic': topic,
+            'language': language,
+            'chat_id': chat_id,
+            'answers': count,
+            'correct_answers': correct,
+            'unique_users': new_users,
+            'updated_at': now,
+        }
+        for (topic, language, chat_id), (count, correct, new_users) in sorted(topics.items())
+    ]
+    for chunk in iter_chunks(topic_rows, chunk_size):
+        stmt = insert(TopicAnswerStats).values(list(chunk))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TopicAnswerStats.topic, TopicAnswerStats.language, TopicAnswerStats.chat_id],
+            set_={
+                'answers': TopicAnswerStats.answers + stmt.excluded.answers,
+                'correct_answers': TopicAnswerStats.correct_answers + stmt.excluded.correct_answers,
+                'unique_users': TopicAnswerStats.unique_users + stmt.excluded.unique_users,
+                'updated_at': stmt.excluded.updated_at,
+            }
+        )
+        await session.execute(stmt)
@@ -0,0 +1,53 @@
+from typing import Iterator, List, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Task, TaskTranslation
+
+
+def iter_chunks(items: Sequence, chunk_size: int) -> Iterator[Sequence]:
+    """
+    Делит последовательность на части не больше chunk_size элементов.
+    """
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+async def bulk_insert_tasks(session: AsyncSession, rows: List[dict], chunk_size: int = 500) -> List[int]:
+    """
+    Записывает пакет задач многострочными INSERT ... RETURNING id без создания ORM-объектов.
+
+    Транзакцию не фиксирует — это делает вызывающий код.
+
+    :param session: Сессия базы данных.
+    :param rows: Проверенные задачи: словари полей Task, у каждого может быть ключ 'translations'
+        со списком словарей полей TaskTranslation (без task_id).
+    :param chunk_size: Максимум строк в одном INSERT.
+    :return: ID созданных задач в порядке rows.
+    """
+    task_ids = []
+    translation_rows = []
+    for chunk in iter_chunks(rows, max(1, chunk_size)):
+        task_rows = [{key: value for key, value in row.items() if key != 'translations'} for row in chunk]
+        result = await session.execute(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True),
+            task_rows
+        )
+        chunk_ids = list(result.scalars())
+        task_ids.extend(chunk_ids)
+
+        for task_id, row in zip(chunk_ids, chunk):
+            for translation in row.get('translations') or ():
+                translation_rows.append({**translation, 'task_id': task_id})
+
+    await bulk_insert_translations(session, translation_rows, chunk_size)
+    return task_ids
+
+
+async def bulk_insert_translations(session: AsyncSession, rows: List[dict], chunk_size: int = 500) -> None:
+    """
+    Записывает переводы задач многострочными INSERT частями по chunk_size строк.
+    """
+    for chunk in iter_chunks(rows, max(1, chunk_size)):
+        await session.execute(insert(TaskTranslation), list(chunk))
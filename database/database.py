@@ -1,16 +1,21 @@
 import logging
-import os
-import datetime
+from collections import OrderedDict
+from typing import Optional
 
 from aiogram.types import message
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from database.base import Base
+from database.engine import engine
 from aiogram import Bot
 from aiogram.types import User as TelegramUser
-from sqlalchemy.future import select
-from database.models import User
+from database.user_buffer import UserWriteBuffer, get_user_row
+from database.answer_buffer import PollAnswerBuffer
+from config import POLL_ANSWER_FLUSH_INTERVAL, POLL_ANSWER_MAX_BATCH, POLL_ANSWER_MAX_PENDING, \
+    POLL_ANSWER_MAX_RETRIES, POLL_MAPPING_CACHE_SIZE, \
+    USER_PROFILE_CACHE_SIZE, USER_FLUSH_INTERVAL_MS, USER_FLUSH_BATCH_SIZE, USER_FLUSH_MAX_PENDING, \
+    USER_FLUSH_MAX_RETRIES
 
 
 
@@ -18,14 +23,6 @@ from database.models import User
 load_dotenv()
 
 
-# Подключение к базе данных через переменную окружения
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-
-# Создаём движок для асинхронной работы с PostgreSQL
-engine = create_async_engine(DATABASE_URL, echo=True)
-
-
 # Создаём фабрику асинхронных сессий
 async_sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False)
 
@@ -40,49 +37,67 @@ async def init_db() -> None:
 
 
 
-async def add_user_if_not_exists(user: TelegramUser, session: AsyncSession):
-    logging.info(f"Вызов add_user_if_not_exists: ID={user.id}, Username={user.username}, Language={user.language_code}")
-
-    try:
-        query = select(User).where(User.telegram_id == user.id)
-        result = await session.execute(query)
-        existing_user = result.scalar_one_or_none()
-
-        if existing_user:
-            logging.info(f"Существующий пользователь найден: ID={user.id}, текущий язык={existing_user.language}")
-
-            # Всегда обновляем язык, даже если он кажется тем же самым
-            existing_user.language = user.language_code
-            logging.info(f"Обновление языка пользователя: {existing_user.language} -> {user.language_code}")
-
-            if existing_user.username != user.username:
-                existing_user.username = user.username
-                logging.info(f"Обновление имени пользователя: {existing_user.username} -> {user.username}")
-
-            try:
-                await session.commit()
-                logging.info(f"Пользователь {user.id} обновлен в базе данных.")
-            except Exception as e:
-                logging.error(f"Ошибка при фиксации изменений в базе данных для пользователя {user.id}: {e}")
-                await session.rollback()
-        else:
-            new_user = User(
-                telegram_id=user.id,
-                username=user.username,
-                subscription_status='active',
-                language=user.language_code,
-                created_at=datetime.datetime.utcnow()
-            )
-            session.add(new_user)
-            try:
-                await session.commit()
-                logging.info(f"Новый пользователь {user.id} добавлен в базу данных.")
-            except Exception as e:
-                logging.error(f"Ошибка при добавлении нового пользователя {user.id} в базе данных: {e}")
-                await session.rollback()
-
-    except Exception as e:
-        logging.error(f"Ошибка при проверке или добавлении пользователя {user.id}: {e}")
-        await session.rollback()
-
-    logging.info(f"Завершение add_user_if_not_exists для пользователя {user.id}")
\ No newline at end of file
+# Кэш профилей пользователей: telegram_id -> хэш (username, language), уже записанный в базу
+_user_profile_cache = OrderedDict()
+
+
+def get_user_profile_hash(user: TelegramUser) -> int:
+    """
+    Возвращает хэш данных профиля, которые сохраняются в таблице users.
+    """
+    return hash((user.username, user.language_code))
+
+
+def remember_user_profile(telegram_id: int, profile_hash: int) -> None:
+    """
+    Запоминает, что профиль пользователя в базе актуален.
+    """
+    _user_profile_cache[telegram_id] = profile_hash
+    _user_profile_cache.move_to_end(telegram_id)
+    if len(_user_profile_cache) > USER_PROFILE_CACHE_SIZE:
+        _user_profile_cache.popitem(last=False)
+
+
+# Буфер отложенной записи профилей: хэндлеры не ждут записи в таблицу users
+user_write_buffer = UserWriteBuffer(
+    async_sessionmaker,
+    flush_interval=USER_FLUSH_INTERVAL_MS / 1000,
+    max_batch=USER_FLUSH_BATCH_SIZE,
+    max_pending=USER_FLUSH_MAX_PENDING,
+    max_retries=USER_FLUSH_MAX_RETRIES,
+    on_flushed=remember_user_profile
+)
+
+# Буфер ответов на опросы: статистика задач пишется пакетами, а не транзакцией на каждый голос
+poll_answer_buffer = PollAnswerBuffer(
+    async_sessionmaker,
+    flush_interval=POLL_ANSWER_FLUSH_INTERVAL,
+    max_batch=POLL_ANSWER_MAX_BATCH,
+    max_pending=POLL_ANSWER_MAX_PENDING,
+    max_retries=POLL_ANSWER_MAX_RETRIES,
+    poll_cache_size=POLL_MAPPING_CACHE_SIZE
+)
+
+
+async def add_user_if_not_exists(user: TelegramUser, session: Optional[AsyncSession] = None):
+    """
+    Добавляет пользователя в базу данных или обновляет его имя и язык.
+
+    Если профиль не изменился с последней записи, ничего не делается. Иначе профиль кладётся
+    в буфер отложенной записи и сохраняется фоновой задачей вместе с другими пользователями
+    (INSERT ... ON CONFLICT DO UPDATE меняет строку, только если данные в базе отличаются).
+    Чтобы дождаться записи, вызовите user_write_buffer.flush().
+
+    :param user: Пользователь Telegram.
+    :param session: Не используется, оставлен для совместимости с вызывающим кодом.
+    """
+    profile_hash = get_user_profile_hash(user)
+    if _user_profile_cache.get(user.id) == profile_hash:
+        _user_profile_cache.move_to_end(user.id)
+        return
+    if user_write_buffer.pending_hash(user.id) == profile_hash:
+        return
+
+    user_write_buffer.put(user.id, get_user_row(user.id, user.username, user.language_code), profile_hash)
+    logging.info(f"Профиль пользователя {user.id} поставлен в очередь записи: "
+                 f"Username={user.username}, Language={user.language_code}")
@@ -0,0 +1,48 @@
+import logging
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, \
+    DB_POOL_PRE_PING, DB_QUERY_CACHE_SIZE, DB_PREPARED_STATEMENT_CACHE_SIZE, DB_ECHO
+
+
+def create_db_engine(url: str = DATABASE_URL, **overrides) -> AsyncEngine:
+    """
+    Создаёт асинхронный движок базы данных с настройками пула из конфигурации.
+
+    :param url: URL подключения к базе данных.
+    :param overrides: Параметры create_async_engine, заменяющие значения из конфигурации.
+    :return: Асинхронный движок.
+    """
+    options = {
+        'echo': DB_ECHO,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'query_cache_size': DB_QUERY_CACHE_SIZE,
+    }
+    if make_url(url).get_driver_name() == 'asyncpg':
+        # Кэш подготовленных запросов на каждом соединении asyncpg: каждый занимает память
+        # серверного процесса PostgreSQL, поэтому размер задаётся отдельно от query_cache_size
+        options['connect_args'] = {'prepared_statement_cache_size': DB_PREPARED_STATEMENT_CACHE_SIZE}
+    options.update(overrides)
+    return create_async_engine(url, **options)
+
+
+def log_pool_status(db_engine: AsyncEngine) -> None:
+    """
+    Пишет в лог настройки и текущее состояние пула соединений.
+    """
+    logging.info(
+        f"Пул соединений с базой данных: pool_size={DB_POOL_SIZE}, max_overflow={DB_MAX_OVERFLOW}, "
+        f"pool_recycle={DB_POOL_RECYCLE}, pre_ping={DB_POOL_PRE_PING}, query_cache={DB_QUERY_CACHE_SIZE}, "
+        f"prepared_statements={DB_PREPARED_STATEMENT_CACHE_SIZE}, echo={DB_ECHO}. "
+        f"Состояние: {db_engine.pool.status()}"
+    )
+
+
+# Единственный движок приложения
+engine = create_db_engine()
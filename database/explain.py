@@ -0,0 +1,121 @@
+"""
+Проверка планов запросов бота.
+
+Выполняет EXPLAIN для запросов, которые бот выполняет на горячих путях (выборка задач для массовой
+публикации, очередь публикации, планировщик, индекс изображений), и предупреждает о последовательном сканировании
+таблиц, для которых ожидается индекс.
+
+Запуск:
+    python -m database.explain             # EXPLAIN
+    python -m database.explain --analyze   # EXPLAIN (ANALYZE, BUFFERS), транзакция откатывается
+    python -m database.explain --strict    # код возврата 1, если найден Seq Scan
+"""
+import argparse
+import asyncio
+import re
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from database.engine import create_db_engine
+from database.models import Group, ImageObject
+
+
+class Explain(Executable, ClauseElement):
+    """
+    Конструкция EXPLAIN [(ANALYZE, BUFFERS)] <запрос> с параметрами исходного запроса.
+    """
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if element.analyze else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+class CheckedQuery(NamedTuple):
+    name: str
+    build: Callable
+    seq_scan_allowed: bool = False  # Запрос читает таблицу целиком намеренно
+
+
+def get_checked_queries() -> List[CheckedQuery]:
+    """
+    Возвращает запросы бота, планы которых проверяются.
+    """
+    # Импорт здесь: запросы собираются теми же функциями, что использует бот
+    from bot.handlers.group_quiz_handler import get_unpublished_tasks_query
+    from bot.handlers.stats_handler import get_topic_stats_query, get_task_stats_query
+    from bot.services.publish_queue import get_ready_chats_query, get_claim_job_query
+    from bot.services.scheduler_service import get_due_posts_query
+    from config import PUBLISH_FETCH_BATCH_SIZE, SCHEDULER_BATCH_SIZE
+
+    now = datetime.utcnow()
+    return [
+        CheckedQuery('unpublished_tasks_page', lambda: get_unpublished_tasks_query(0, PUBLISH_FETCH_BATCH_SIZE)),
+        CheckedQuery('publish_ready_chats', lambda: get_ready_chats_query(now)),
+        CheckedQuery('publish_claim_job', lambda: get_claim_job_query(0, now)),
+        CheckedQuery('scheduler_due_posts', lambda: get_due_posts_query(now, SCHEDULER_BATCH_SIZE)),
+        CheckedQuery('image_by_hash', lambda: select(ImageObject.url).where(ImageObject.content_hash == '0' * 64)),
+        CheckedQuery('group_routing_load', lambda: select(Group), seq_scan_allowed=True),
+        CheckedQuery('stats_topics', get_topic_stats_query, seq_scan_allowed=True),
+        CheckedQuery('stats_task', lambda: get_task_stats_query(0)),
+    ]
+
+
+async def explain_queries(analyze: bool = False) -> int:
+    """
+    Выводит планы запросов и возвращает количество запросов с неожиданным Seq Scan.
+    """
+    engine = create_db_engine(pool_size=1, max_overflow=0)
+    problems = 0
+    try:
+        async with engine.connect() as conn:
+            for query in get_checked_queries():
+                result = await conn.execute(Explain(query.build(), analyze=analyze))
+                plan = [row[0] for row in result]
+                # ANALYZE действительно выполняет запрос (в том числе FOR UPDATE) — откатываем
+                await conn.rollback()
+
+                seq_scans = sorted(set(re.findall(r'Seq Scan on (\w+)', '\n'.join(plan))))
+                if seq_scans and not query.seq_scan_allowed:
+                    problems += 1
+                    status = f"ВНИМАНИЕ: Seq Scan по {', '.join(seq_scans)}"
+                else:
+                    status = "OK"
+
+                print(f"== {query.name}: {status}")
+                for line in plan:
+                    print(f"   {line}")
+                print()
+    finally:
+        await engine.dispose()
+
+    if problems:
+        print(f"Запросов с последовательным сканированием: {problems}. На маленьких таблицах это нормально: "
+              f"планировщик выбирает Seq Scan, пока таблица меньше нескольких страниц.")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Проверка планов запросов бота")
+    parser.add_argument('--analyze', action='store_true', help="Выполнить EXPLAIN (ANALYZE, BUFFERS)")
+    parser.add_argument('--strict', action='store_true', help="Завершиться с кодом 1 при Seq Scan")
+    args = parser.parse_args()
+
+    problems = asyncio.run(explain_queries(analyze=args.analyze))
+    if args.strict and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
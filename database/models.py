@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, Boolean, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, Boolean, DateTime, BigInteger, \
+    UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from database.base import Base
 from datetime import datetime
@@ -12,6 +13,12 @@ def get_current_time():
 
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Постраничная выборка неопубликованных задач (WHERE published IS false AND id > :last ORDER BY id)
+        Index('ix_tasks_unpublished_id', 'id', postgresql_where=text('published IS false')),
+        Index('ix_tasks_unpublished_topic_language', 'topic', 'language', postgresql_where=text('published IS false')),
+        Index('ix_tasks_group_id_publish_date', 'group_id', 'publish_date'),
+    )
 
     id = Column(Integer, primary_key=True)
     topic = Column(String, nullable=False)
@@ -22,6 +29,7 @@ class Task(Base):
     explanation = Column(String, nullable=True)
     resource_link = Column(String, nullable=True)
     image_url = Column(String, nullable=True)
+    image_file_id = Column(String, nullable=True)  # file_id изображения в Telegram после первой отправки
     short_description = Column(String, nullable=True)
     published = Column(Boolean, default=False, nullable=False)
     publish_date = Column(DateTime, nullable=True)
@@ -63,6 +71,9 @@ class User(Base):
 
 class TaskStatistics(Base):
     __tablename__ = 'task_statistics'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'task_id', name='uq_task_statistics_user_task'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -77,9 +88,116 @@ class TaskStatistics(Base):
 
 class Group(Base):
     __tablename__ = 'groups'
+    __table_args__ = (
+        Index('ix_groups_topic_language', 'topic', 'language'),
+    )
 
     id = Column(Integer, primary_key=True)
     group_name = Column(String, nullable=False)
     group_id = Column(BigInteger, unique=True, nullable=False)
     topic = Column(String, nullable=False)
-    language = Column(String, nullable=False)  # Добавляем поле языка
\ No newline at end of file
+    language = Column(String, nullable=False)  # Добавляем поле языка
+
+class ImageObject(Base):
+    __tablename__ = 'image_objects'
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 от PNG-байтов изображения
+    key = Column(String, nullable=False)  # Ключ объекта в S3
+    url = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=get_current_time, nullable=False)
+
+
+class PublishJob(Base):
+    __tablename__ = 'publish_jobs'
+    __table_args__ = (
+        UniqueConstraint('task_id', 'chat_id', name='uq_publish_jobs_task_chat'),
+        # Выборка готовых заданий группы (полоса публикации)
+        Index('ix_publish_jobs_ready', 'chat_id', 'id', postgresql_where=text("state != 'done' AND failed IS false")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)  # Telegram ID группы
+    state = Column(String, default='pending', nullable=False)  # Последний успешно выполненный шаг публикации
+    failed = Column(Boolean, default=False, nullable=False)  # Попытки исчерпаны, нужна повторная постановка в очередь
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime, nullable=True)  # Задание взято воркером до этого момента
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    task = relationship('Task')
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+
+    key = Column(String, primary_key=True)  # Ключ FSM: fsm:<chat_id>:<user_id>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # Данные состояния в компактном JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class PollMapping(Base):
+    __tablename__ = 'poll_mappings'
+
+    poll_id = Column(String, primary_key=True)  # ID опроса Telegram
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)  # Группа, в которой опубликован опрос
+    correct_option_id = Column(Integer, nullable=False)  # Номер правильного варианта после перемешивания
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TaskAnswerStats(Base):
+    __tablename__ = 'task_answer_stats'
+
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True)
+    topic = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    answers = Column(Integer, default=0, nullable=False)  # Всего ответов на опросы задачи
+    correct_answers = Column(Integer, default=0, nullable=False)
+    unique_users = Column(Integer, default=0, nullable=False)  # Пользователей, ответивших хотя бы раз
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TopicAnswerStats(Base):
+    __tablename__ = 'topic_answer_stats'
+
+    topic = Column(String, primary_key=True)
+    language = Column(String, primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)  # Группа, в которой отвечали
+    answers = Column(Integer, default=0, nullable=False)
+    correct_answers = Column(Integer, default=0, nullable=False)
+    unique_users = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TopicAnswerUser(Base):
+    __tablename__ = 'topic_answer_users'  # Кто отвечал в теме и группе (для unique_users в TopicAnswerStats)
+
+    topic = Column(String, primary_key=True)
+    language = Column(String, primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+
+
+class ScheduledPost(Base):
+    __tablename__ = 'scheduled_posts'
+    __table_args__ = (
+        # Выборка ближайших запланированных публикаций (окно таймера планировщика)
+        Index('ix_scheduled_posts_due', 'run_at', 'id', postgresql_where=text("state = 'scheduled'")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(BigInteger, nullable=True)  # Группа; если не указана — по теме и языку задачи
+    run_at = Column(DateTime, nullable=False)  # Время публикации (UTC)
+    misfire_grace = Column(Integer, nullable=True)  # Сколько секунд после run_at публикация ещё актуальна (NULL — всегда)
+    state = Column(String, default='scheduled', nullable=False)  # scheduled, enqueued, skipped, failed, cancelled
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    task = relationship('Task')
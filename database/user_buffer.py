@@ -0,0 +1,87 @@
+import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
+
+from database.models import User
+from database.write_buffer import WriteBuffer
+
+
+class UserWriteBuffer(WriteBuffer):
+    """
+    Буфер отложенной записи профилей пользователей.
+
+    Хэндлеры только кладут изменившийся профиль в буфер (повторные изменения одного пользователя
+    схлопываются), а фоновая задача раз в flush_interval секунд или при накоплении max_batch записей
+    сохраняет всё одним многострочным INSERT ... ON CONFLICT DO UPDATE. Обработка ошибок записи —
+    см. WriteBuffer.
+    """
+
+    description = 'профилей пользователей'
+
+    def __init__(self, session_maker, flush_interval: float = 0.5, max_batch: int = 500,
+                 max_pending: int = 100000, max_retries: int = 10,
+                 on_flushed: Optional[Callable[[int, int], None]] = None):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param flush_interval: Интервал записи буфера в базу (сек.).
+        :param max_batch: Количество записей, при котором буфер записывается, не дожидаясь интервала.
+        :param max_pending: Максимум профилей в буфере.
+        :param max_retries: Сколько раз повторять запись профиля после ошибки.
+        :param on_flushed: Вызывается для каждого записанного пользователя: (telegram_id, хэш профиля).
+        """
+        super().__init__(session_maker, flush_interval, max_batch, max_pending, max_retries)
+        self.on_flushed = on_flushed
+        self.queued = 0
+
+    def put(self, telegram_id: int, values: dict, profile_hash: int) -> None:
+        """
+        Кладёт профиль пользователя в буфер.
+        """
+        self._put(telegram_id, (values, profile_hash))
+        self.queued += 1
+
+    def pending_hash(self, telegram_id: int) -> Optional[int]:
+        """
+        Возвращает хэш профиля, ожидающего записи, или None.
+        """
+        entry = self._pending.get(telegram_id)
+        return entry[1] if entry else None
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику буфера.
+        """
+        return {**super().stats(), 'queued': self.queued}
+
+    async def _write(self, session, batch: Dict[int, Tuple[dict, int]]) -> int:
+        stmt = insert(User).values([values for values, _ in batch.values()])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={'username': stmt.excluded.username, 'language': stmt.excluded.language},
+            where=or_(
+                User.username.is_distinct_from(stmt.excluded.username),
+                User.language.is_distinct_from(stmt.excluded.language)
+            )
+        )
+        await session.execute(stmt)
+        return len(batch)
+
+    def _on_written(self, batch: Dict[int, Tuple[dict, int]]) -> None:
+        if self.on_flushed is not None:
+            for telegram_id, (_, profile_hash) in batch.items():
+                self.on_flushed(telegram_id, profile_hash)
+
+
+def get_user_row(telegram_id: int, username: Optional[str], language: Optional[str]) -> dict:
+    """
+    Возвращает поля строки users для нового пользователя.
+    """
+    return {
+        'telegram_id': telegram_id,
+        'username': username,
+        'subscription_status': 'active',
+        'language': language,
+        'created_at': datetime.datetime.utcnow(),
+    }
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Hashable, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+
+class WriteBuffer(ABC):
+    """
+    Основа буферов отложенной записи в базу данных.
+
+    Записи копятся в памяти по ключу (повторная запись по тому же ключу заменяет предыдущую) и
+    сохраняются фоновой задачей пакетами: раз в flush_interval секунд или при накоплении max_batch записей.
+
+    Ошибки записи не блокируют буфер:
+    - при нарушении ограничения базы (IntegrityError) пакет делится пополам, пока не останутся
+      отдельные записи, которые не удаётся сохранить; такие записи отбрасываются с сообщением в лог;
+    - при других ошибках (база недоступна) записи возвращаются в буфер, но не больше max_retries раз;
+    - в буфере не больше max_pending записей: при переполнении отбрасываются самые старые.
+
+    Наследники реализуют _write (запись пакета в открытой сессии без фиксации транзакции).
+    """
+
+    # Что хранится в буфере (для сообщений в логе)
+    description = 'записей'
+
+    def __init__(self, session_maker, flush_interval: float, max_batch: int,
+                 max_pending: int = 100000, max_retries: int = 10):
+        """
+        :param session_maker: Фабрика сессий базы данных.
+        :param flush_interval: Интервал записи буфера в базу (сек.).
+        :param max_batch: Количество записей, при котором буфер записывается, не дожидаясь интервала.
+        :param max_pending: Максимум записей в буфере.
+        :param max_retries: Сколько раз повторять запись после ошибки, прежде чем отбросить запись.
+        """
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._pending: Dict[Hashable, tuple] = {}
+        self._retries: Dict[Hashable, int] = {}  # Ключ -> число неудачных попыток записи
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0  # Отброшено из-за переполнения буфера или исчерпания повторов
+        self.rejected = 0  # Отклонено базой данных (нарушение ограничений)
+        self._dropped_logged = 0
+
+    def start(self) -> None:
+        """
+        Запускает фоновую запись буфера.
+        """
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую запись и сохраняет оставшиеся записи.
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные записи в базу данных.
+
+        :return: Результат _write, просуммированный по записанным частям пакета.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            written = await self._write_batch(batch)
+
+        if self.dropped > self._dropped_logged:
+            logging.warning(f"Буфер {self.description} переполнен или база недоступна: "
+                            f"отброшено {self.dropped - self._dropped_logged} шт.")
+            self._dropped_logged = self.dropped
+        self.flushes += 1
+        return written
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику буфера.
+        """
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'flushes': self.flushes,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
+
+    def _put(self, key: Hashable, entry: tuple) -> None:
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self._drop(next(iter(self._pending)))
+        self._pending[key] = entry
+        # Новые данные по ключу пишутся с чистого счётчика повторов
+        self._retries.pop(key, None)
+        if len(self._pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drop(self, key: Hashable) -> None:
+        self._pending.pop(key, None)
+        self._retries.pop(key, None)
+        self.dropped += 1
+
+    async def _write_batch(self, batch: Dict[Hashable, tuple]) -> int:
+        try:
+            async with self.session_maker() as session:
+                written = await self._write(session, batch)
+                await session.commit()
+        except IntegrityError as e:
+            self._on_integrity_error(batch)
+            if len(batch) == 1:
+                key = next(iter(batch))
+                self._retries.pop(key, None)
+                self.rejected += 1
+                logging.error(f"Запись {key} из буфера {self.description} отклонена базой данных и отброшена: {e}")
+                return 0
+            # Ищем записи, нарушающие ограничения, делением пакета пополам
+            items = list(batch.items())
+            middle = len(items) // 2
+            first, second = dict(items[:middle]), dict(items[middle:])
+            try:
+                written = await self._write_batch(first)
+            except BaseException:
+                self._requeue(second)
+                raise
+            return written + await self._write_batch(second)
+        except BaseException as e:
+            self._requeue(batch)
+            if not isinstance(e, Exception):
+                raise
+            logging.error(f"Ошибка при записи {self.description} ({len(batch)} шт.): {e}")
+            return 0
+
+        for key in batch:
+            self._retries.pop(key, None)
+        self.written += len(batch)
+        self._on_written(batch)
+        logging.debug(f"Записано {self.description}: {len(batch)}")
+        return written
+
+    def _requeue(self, batch: Dict[Hashable, tuple]) -> None:
+        # Возвращаем записи в буфер, не затирая более свежие
+        for key, entry in batch.items():
+            if key in self._pending:
+                continue
+            retries = self._retries.get(key, 0) + 1
+            if retries > self.max_retries or len(self._pending) >= self.max_pending:
+                self._drop(key)
+                continue
+            self._retries[key] = retries
+            self._pending[key] = entry
+
+    @abstractmethod
+    async def _write(self, session, batch: Dict[Hashable, tuple]) -> int:
+        """
+        Записывает пакет в открытой сессии, не фиксируя транзакцию.
+
+        :return: Количество записанных строк (суммируется в результате flush).
+        """
+
+    def _on_integrity_error(self, batch: Dict[Hashable, tuple]) -> None:
+        """
+        Вызывается, когда пакет отклонён базой (например, чтобы сбросить устаревший кэш).
+        """
+
+    def _on_written(self, batch: Dict[Hashable, tuple]) -> None:
+        """
+        Вызывается после успешной записи пакета.
+        """
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,86 @@
+"""Add task and topic answer aggregates
+
+Revision ID: 1e5b7c9d3a62
+Revises: 8c3e7a2d9f51
+Create Date: 2026-10-18 18:12:36.540871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1e5b7c9d3a62'
+down_revision: Union[str, None] = '8c3e7a2d9f51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_answer_stats',
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('answers', sa.Integer(), nullable=False),
+        sa.Column('correct_answers', sa.Integer(), nullable=False),
+        sa.Column('unique_users', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('task_id')
+    )
+    op.create_table(
+        'topic_answer_stats',
+        sa.Column('topic', sa.String(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('answers', sa.Integer(), nullable=False),
+        sa.Column('correct_answers', sa.Integer(), nullable=False),
+        sa.Column('unique_users', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('topic', 'language', 'chat_id')
+    )
+    op.create_table(
+        'topic_answer_users',
+        sa.Column('topic', sa.String(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('topic', 'language', 'chat_id', 'user_id')
+    )
+
+    # Начальные агрегаты из уже накопленной task_statistics. Число верных ответов там не хранится,
+    # поэтому для старых данных считаем по одному верному ответу на пользователя, решившего задачу.
+    op.execute("""
+        INSERT INTO task_answer_stats (task_id, topic, language, answers, correct_answers, unique_users, updated_at)
+        SELECT t.id, t.topic, coalesce(t.language, ''), sum(ts.attempts), count(*) FILTER (WHERE ts.successful),
+               count(*), now() AT TIME ZONE 'utc'
+        FROM task_statistics AS ts
+        JOIN tasks AS t ON t.id = ts.task_id
+        GROUP BY t.id
+    """)
+    op.execute("""
+        INSERT INTO topic_answer_users (topic, language, chat_id, user_id)
+        SELECT DISTINCT t.topic, coalesce(t.language, ''), t.group_id, ts.user_id
+        FROM task_statistics AS ts
+        JOIN tasks AS t ON t.id = ts.task_id
+        WHERE t.group_id IS NOT NULL
+    """)
+    op.execute("""
+        INSERT INTO topic_answer_stats (topic, language, chat_id, answers, correct_answers, unique_users, updated_at)
+        SELECT t.topic, coalesce(t.language, ''), t.group_id, sum(ts.attempts), count(*) FILTER (WHERE ts.successful),
+               count(DISTINCT ts.user_id), now() AT TIME ZONE 'utc'
+        FROM task_statistics AS ts
+        JOIN tasks AS t ON t.id = ts.task_id
+        WHERE t.group_id IS NOT NULL
+        GROUP BY t.topic, coalesce(t.language, ''), t.group_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('topic_answer_users')
+    op.drop_table('topic_answer_stats')
+    op.drop_table('task_answer_stats')
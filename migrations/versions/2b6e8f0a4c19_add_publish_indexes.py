@@ -0,0 +1,42 @@
+"""Add indexes for publish queries
+
+Revision ID: 2b6e8f0a4c19
+Revises: 7d2f9b1c3e84
+Create Date: 2026-10-18 14:02:55.817340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b6e8f0a4c19'
+down_revision: Union[str, None] = '7d2f9b1c3e84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tasks_unpublished_id', 'tasks', ['id'], unique=False,
+                    postgresql_where=sa.text('published IS false'))
+    op.create_index('ix_tasks_unpublished_topic_language', 'tasks', ['topic', 'language'], unique=False,
+                    postgresql_where=sa.text('published IS false'))
+    op.create_index('ix_tasks_group_id_publish_date', 'tasks', ['group_id', 'publish_date'], unique=False)
+    op.create_index('ix_groups_topic_language', 'groups', ['topic', 'language'], unique=False)
+
+    op.drop_index('ix_publish_jobs_state_next_attempt', table_name='publish_jobs')
+    op.create_index('ix_publish_jobs_ready', 'publish_jobs', ['chat_id', 'id'], unique=False,
+                    postgresql_where=sa.text("state != 'done' AND failed IS false"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_publish_jobs_ready', table_name='publish_jobs')
+    op.create_index('ix_publish_jobs_state_next_attempt', 'publish_jobs', ['state', 'failed', 'next_attempt_at'],
+                    unique=False)
+
+    op.drop_index('ix_groups_topic_language', table_name='groups')
+    op.drop_index('ix_tasks_group_id_publish_date', table_name='tasks')
+    op.drop_index('ix_tasks_unpublished_topic_language', table_name='tasks')
+    op.drop_index('ix_tasks_unpublished_id', table_name='tasks')
@@ -0,0 +1,42 @@
+"""Add scheduled_posts table
+
+Revision ID: 6b2d4f8e1a93
+Revises: 1e5b7c9d3a62
+Create Date: 2026-10-18 19:26:14.903557
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b2d4f8e1a93'
+down_revision: Union[str, None] = '1e5b7c9d3a62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'scheduled_posts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=True),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('misfire_grace', sa.Integer(), nullable=True),
+        sa.Column('state', sa.String(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_scheduled_posts_due', 'scheduled_posts', ['run_at', 'id'], unique=False,
+                    postgresql_where=sa.text("state = 'scheduled'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scheduled_posts_due', table_name='scheduled_posts')
+    op.drop_table('scheduled_posts')
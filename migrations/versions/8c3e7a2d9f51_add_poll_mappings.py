@@ -0,0 +1,58 @@
+"""Add poll_mappings and unique task_statistics per user and task
+
+Revision ID: 8c3e7a2d9f51
+Revises: 4f9a1d6e2c37
+Create Date: 2026-10-18 17:05:43.118206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3e7a2d9f51'
+down_revision: Union[str, None] = '4f9a1d6e2c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'poll_mappings',
+        sa.Column('poll_id', sa.String(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('correct_option_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('poll_id')
+    )
+
+    # Сводим возможные дубли (пользователь, задача) в одну строку перед созданием ограничения
+    op.execute("""
+        UPDATE task_statistics AS ts
+        SET attempts = agg.attempts,
+            successful = agg.successful,
+            last_attempt_date = agg.last_attempt_date
+        FROM (
+            SELECT min(id) AS id, sum(attempts) AS attempts, bool_or(successful) AS successful,
+                   max(last_attempt_date) AS last_attempt_date
+            FROM task_statistics
+            GROUP BY user_id, task_id
+            HAVING count(*) > 1
+        ) AS agg
+        WHERE ts.id = agg.id
+    """)
+    op.execute("""
+        DELETE FROM task_statistics AS ts
+        USING task_statistics AS keep
+        WHERE ts.user_id = keep.user_id AND ts.task_id = keep.task_id AND ts.id > keep.id
+    """)
+    op.create_unique_constraint('uq_task_statistics_user_task', 'task_statistics', ['user_id', 'task_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_task_statistics_user_task', 'task_statistics', type_='unique')
+    op.drop_table('poll_mappings')